@@ -0,0 +1,560 @@
+__doc__ = """Submodule with caches for model matrices.
+
+- MatrixCache : bounded, in-memory store of the matrices built by a model.
+- MatrixRegistry : process-wide index of the matrices built for each
+  genotype-phenotype map, shared by all models attached to the map.
+- SVDCache : factorization of the last matrix a linear model was fit to,
+  reused when the same matrix is fit to new phenotypes.
+- ModelMatrixCache : persistent store of model matrices on disk.
+"""
+# -------------------------------------------------------
+# Outside imports
+# -------------------------------------------------------
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import issparse
+
+# -------------------------------------------------------
+# Local imports
+# -------------------------------------------------------
+
+from .matrix import SiteTable, sites_to_table, _binary_to_bits
+
+
+def hash_model_matrix(binary_genotypes, sites, model_type='global',
+                      dtype=np.int8):
+    """Hash the inputs that determine a model matrix.
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    sites : list
+        List of epistatic interaction sites.
+
+    model_type : string
+        Type of epistasis model (global/Hadamard, local/Biochemical).
+
+    dtype : numpy dtype
+        data type of the matrix.
+
+    Returns
+    -------
+    key : str
+        hex digest identifying the model matrix.
+    """
+    bits = _binary_to_bits(binary_genotypes)
+    site_table, site_orders = sites_to_table(sites)
+    h = hashlib.sha1()
+    h.update(np.array(bits.shape, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(bits).tobytes())
+    h.update(site_table.tobytes())
+    h.update(site_orders.tobytes())
+    h.update(model_type.encode("ascii"))
+    h.update(np.dtype(dtype).str.encode("ascii"))
+    return h.hexdigest()
+
+
+def _matrix_nbytes(X):
+    """Bytes held by a stored matrix."""
+    if issparse(X):
+        X = X.tocsr()
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    if isinstance(X, pd.DataFrame):
+        return int(X.memory_usage(index=False).sum())
+    return int(getattr(X, "nbytes", 0))
+
+
+def _buffer_key(X):
+    """Identify the memory behind a stored matrix. Arrays viewing the same
+    memory with the same layout share a key."""
+    if isinstance(X, np.ndarray):
+        return (X.__array_interface__["data"][0], X.shape, X.strides,
+                X.dtype.str)
+    return id(X)
+
+
+class MatrixCache(MutableMapping):
+    """In-memory store of the matrices built by a model, keyed by the
+    method that used them ('obs', 'fit', 'predict', ...).
+
+    Behaves like a dict, but keys storing the same matrix (or views of the
+    same memory with the same layout) share one buffer, and when the
+    buffers exceed max_bytes, the least recently used keys are dropped.
+
+    Only matrices stored with a ``source`` (e.g. "obs", the matrix of the
+    attached map) can be dropped; the cache remembers the source of a
+    dropped key, so the model can rebuild it (see ``source``). Matrices
+    stored without a source, such as arrays given by the user, are never
+    dropped.
+
+    Parameters
+    ----------
+    max_bytes : int (default=None)
+        maximum total size of the stored matrices. None never evicts.
+
+    Attributes
+    ----------
+    hits : int
+        number of lookups that found a matrix.
+
+    misses : int
+        number of lookups that did not.
+
+    evictions : int
+        number of keys dropped to fit in max_bytes.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> buffer key, in order of use (least recent first).
+        self._keys = OrderedDict()
+        # buffer key -> [matrix, number of keys, bytes, source]
+        self._buffers = {}
+        self._nbytes = 0
+        # key -> source, kept after the key is dropped.
+        self._sources = {}
+
+    def __repr__(self):
+        return "MatrixCache(keys={}, nbytes={}, max_bytes={})".format(
+            list(self._keys), self._nbytes, self.max_bytes)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __getitem__(self, key):
+        try:
+            buffer = self._keys[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._keys.move_to_end(key)
+        return self._buffers[buffer][0]
+
+    def __setitem__(self, key, X):
+        self.put(key, X)
+
+    def __delitem__(self, key):
+        self._drop(key)
+        self._sources.pop(key, None)
+
+    def _drop(self, key):
+        """Remove a key, keeping its source."""
+        buffer = self._keys.pop(key)
+        entry = self._buffers[buffer]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._buffers[buffer]
+            self._nbytes -= entry[2]
+
+    def put(self, key, X, source=None):
+        """Store a matrix under key and return it. Matrices are matched by
+        their buffer, never by value, so storing is O(1).
+
+        Parameters
+        ----------
+        key : str
+            name of the matrix.
+
+        X : array
+            matrix to store.
+
+        source : str (default=None)
+            name of the data X can be rebuilt from, e.g. "obs". Keys
+            storing a buffer that has a source may be dropped to fit in
+            max_bytes. Storing a buffer that is already stored keeps its
+            source.
+        """
+        if key in self._keys:
+            # Storing the same matrix again only marks it as used.
+            entry = self._buffers[self._keys[key]]
+            if entry[0] is X and (source is None or entry[3] == source):
+                self._keys.move_to_end(key)
+                return X
+            self._drop(key)
+
+        buffer = _buffer_key(X)
+        if buffer not in self._buffers:
+            nbytes = _matrix_nbytes(X)
+            self._buffers[buffer] = [X, 0, nbytes, source]
+            self._nbytes += nbytes
+        entry = self._buffers[buffer]
+        if source is not None:
+            entry[3] = source
+        entry[1] += 1
+        self._keys[key] = buffer
+        self._sources[key] = entry[3]
+
+        self.evict(keep=key)
+        return self._buffers[buffer][0]
+
+    def source(self, key):
+        """Source of the matrix stored (or dropped) under key, or None if
+        the matrix cannot be rebuilt."""
+        return self._sources.get(key)
+
+    def link(self, key, source):
+        """Mark key as a matrix of source, without storing it. Looking up
+        key misses until the matrix is rebuilt from its source."""
+        if key in self._keys:
+            self._drop(key)
+        self._sources[key] = source
+
+    def evict(self, keep=None):
+        """Drop least recently used keys that have a source until the stored
+        matrices fit in max_bytes."""
+        if self.max_bytes is None:
+            return
+        for key in list(self._keys):
+            if self._nbytes <= self.max_bytes:
+                break
+            if key == keep or self._sources.get(key) is None:
+                continue
+            self._drop(key)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all matrices and sources. Statistics are kept."""
+        self._keys.clear()
+        self._buffers.clear()
+        self._sources.clear()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        """Total size of the stored matrices, counting shared buffers
+        once."""
+        return self._nbytes
+
+    @property
+    def stats(self):
+        """Dictionary of cache statistics."""
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, keys=len(self._keys),
+                    buffers=len(self._buffers), nbytes=self._nbytes,
+                    max_bytes=self.max_bytes)
+
+
+class MatrixRegistry(object):
+    """Process-wide index of the model matrices built for genotype-phenotype
+    maps.
+
+    Models attached to maps with the same genotypes (for example, a
+    nonlinear model and its Additive sub-model, or the stages of a
+    pipeline, which pass transformed copies of the map to each other) look
+    up the matrix of the map here before building their own. A request is
+    served by any registered matrix of the same genotypes, model type and
+    data type whose leading columns are the requested sites; since columns
+    are ordered by order, a first-order request is a column slice (no copy)
+    of a higher-order matrix.
+
+    Matrices are held by weak references, so a matrix stays in the
+    registry only while some model keeps it.
+    """
+    def __init__(self):
+        # (genotypes hash, model_type, dtype) -> list of [X ref, sites]
+        self._entries = {}
+        # id(gpm) -> (gpm ref, genotypes hash)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _hash_map(self, gpm):
+        """Hash the wildtype, genotypes and mutations of a map. Hashes are
+        remembered for as long as the map exists."""
+        ref, key = self._hashes.get(id(gpm), (None, None))
+        if ref is not None and ref() is gpm:
+            return key
+
+        h = hashlib.sha1()
+        h.update(str(gpm.wildtype).encode("utf-8"))
+        h.update(json.dumps(sorted((int(k), v) for k, v in
+                                   gpm.mutations.items())).encode("utf-8"))
+        genotypes = np.asarray(gpm.genotypes).astype(str)
+        h.update(str(genotypes.dtype).encode("ascii"))
+        h.update(np.ascontiguousarray(genotypes).tobytes())
+        key = h.hexdigest()
+
+        self._hashes = {i: (r, k) for i, (r, k) in self._hashes.items()
+                        if r() is not None}
+        self._hashes[id(gpm)] = (weakref.ref(gpm), key)
+        return key
+
+    def _key(self, gpm, model_type, dtype):
+        return (self._hash_map(gpm), model_type, np.dtype(dtype).str)
+
+    def get(self, gpm, sites, model_type='global', dtype=np.int8):
+        """Get a matrix for the genotypes of gpm and the given sites, or
+        None if no registered matrix covers them."""
+        sites = SiteTable.from_sites(sites)
+        with self._lock:
+            entries = list(self._entries.get(
+                self._key(gpm, model_type, dtype), []))
+        for X_ref, columns in entries:
+            X = X_ref()
+            if X is None or len(columns) < len(sites):
+                continue
+            if len(columns) == len(sites):
+                if columns == sites:
+                    return X
+            elif columns[:len(sites)] == sites:
+                return X[:, :len(sites)]
+        return None
+
+    def put(self, gpm, sites, X, model_type='global'):
+        """Register the matrix X built for the genotypes of gpm and the
+        given sites."""
+        if not isinstance(X, np.ndarray):
+            return
+        sites = SiteTable.from_sites(sites)
+        with self._lock:
+            key = self._key(gpm, model_type, X.dtype)
+            # Drop matrices that no longer exist.
+            entries = [entry for entry in self._entries.get(key, [])
+                       if entry[0]() is not None]
+            entries.append([weakref.ref(X), sites])
+            self._entries[key] = entries
+
+    def clear(self):
+        """Remove all matrices from the registry."""
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+
+
+# Registry shared by all models in this process.
+MATRIX_REGISTRY = MatrixRegistry()
+
+
+class SVDCache(object):
+    """Singular value decomposition of the last model matrix a linear model
+    was fit to.
+
+    Fitting the same matrix again (in bootstraps, permutation tests, or
+    simulations, which change only y) reuses the decomposition, so each fit
+    is two matrix-vector products instead of a new decomposition. Matrices
+    are matched by their buffer, so views of the same memory share a
+    decomposition. Matrices modified in place after a fit are not detected.
+
+    The factors are float64, several times the size of an int8 matrix, so
+    they are only kept if keep is True. The matrix itself is held by a weak
+    reference; its decomposition is dropped with it.
+
+    Solutions are the minimum-norm least-squares solutions, as in
+    numpy.linalg.lstsq, or ridge solutions for alpha > 0.
+
+    Parameters
+    ----------
+    keep : bool (default=True)
+        keep the factors of the last matrix for refits.
+
+    Attributes
+    ----------
+    U, s, Vt : numpy.ndarray
+        decomposition ``X = U @ diag(s) @ Vt`` of the last matrix. U and Vt
+        are None unless keep is True.
+    """
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.clear()
+
+    def clear(self):
+        """Drop the stored decomposition."""
+        self._key = None
+        self._ref = None
+        self._shape = None
+        self.U = None
+        self.s = None
+        self.Vt = None
+
+    @property
+    def nbytes(self):
+        """Size of the stored decomposition."""
+        return sum(a.nbytes for a in (self.U, self.s, self.Vt)
+                   if a is not None)
+
+    def factorize(self, X):
+        """Decompose X, unless it is the last matrix decomposed."""
+        key = _buffer_key(X)
+        owner = None if self._ref is None else self._ref()
+        if owner is not None and key == self._key and self.U is not None:
+            return self.U, self.s, self.Vt
+
+        self.clear()
+        U, s, Vt = np.linalg.svd(np.asarray(X, dtype=float),
+                                 full_matrices=False)
+        self._shape = X.shape
+        self.s = s
+        if self.keep:
+            # While the array owning X's memory lives, no other matrix can
+            # have its buffer.
+            while isinstance(X.base, np.ndarray):
+                X = X.base
+            self._key, self._ref = key, weakref.ref(X)
+            self.U, self.Vt = U, Vt
+        return U, s, Vt
+
+    @property
+    def rank(self):
+        """Numerical rank of the last matrix (see numpy.linalg.lstsq)."""
+        return int(np.sum(self.s > self._cutoff()))
+
+    def _cutoff(self):
+        """Singular values at or below this are treated as zero."""
+        if len(self.s) == 0:
+            return 0.0
+        eps = np.finfo(float).eps
+        return eps * max(self._shape) * self.s[0]
+
+    def solve(self, X, y, alpha=0.0):
+        """Solve ``X @ coef = y`` in the least-squares sense.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            model matrix.
+
+        y : array-like
+            phenotypes, 1d, or 2d with one column per set of phenotypes.
+
+        alpha : float (default=0.0)
+            L2 penalty. 0 gives the minimum-norm least-squares solution.
+
+        Returns
+        -------
+        coef : numpy.ndarray
+            coefficients, with one column per column of y if y is 2d.
+        """
+        U, s, Vt = self.factorize(X)
+        y = np.asarray_chkfinite(y, dtype=float)
+        if alpha > 0:
+            d = s / (s**2 + alpha)
+        else:
+            d = np.zeros_like(s)
+            nonzero = s > self._cutoff()
+            d[nonzero] = 1 / s[nonzero]
+        b = U.T.dot(y)
+        b *= d.reshape((-1,) + (1,) * (b.ndim - 1))
+        return Vt.T.dot(b)
+
+
+class ModelMatrixCache(object):
+    """Persistent cache of model matrices on disk.
+
+    Each matrix is stored as a .npy file named by a hash of the genotypes,
+    sites, model type and data type that built it, and is reopened as a
+    read-only memory map, so processes reading the same matrix share pages.
+    When the files exceed max_bytes, the least recently used files are
+    removed.
+
+    Parameters
+    ----------
+    path : str
+        directory holding the cache. Created if it does not exist.
+
+    max_bytes : int (default=4 GB)
+        maximum total size of the cached files.
+    """
+    def __init__(self, path, max_bytes=2**32):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def __contains__(self, key):
+        return os.path.exists(self.filename(key))
+
+    def key(self, binary_genotypes, sites, model_type='global',
+            dtype=np.int8):
+        """Key of the model matrix for the given inputs (see
+        hash_model_matrix)."""
+        return hash_model_matrix(binary_genotypes, sites,
+                                 model_type=model_type, dtype=dtype)
+
+    def filename(self, key):
+        """Path of the file storing a matrix."""
+        return os.path.join(self.path, key + ".npy")
+
+    def get(self, key):
+        """Get a cached matrix as a read-only memory map. Returns None if
+        the matrix is not in the cache."""
+        filename = self.filename(key)
+        try:
+            X = np.load(filename, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+        # Mark as recently used.
+        os.utime(filename)
+        return X
+
+    def put(self, key, X):
+        """Write a matrix to the cache and return it as a read-only memory
+        map."""
+        # Write to a temporary file first so that readers in other
+        # processes never see a partial file.
+        fd, tmp = tempfile.mkstemp(suffix=".npy.tmp", dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.asarray(X))
+        os.replace(tmp, self.filename(key))
+
+        self.evict(keep=key)
+        return np.load(self.filename(key), mmap_mode='r')
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache fits in
+        max_bytes."""
+        files = []
+        for filename in glob.glob(os.path.join(self.path, "*.npy")):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, filename))
+
+        total = sum(size for _, size, _ in files)
+        keep = None if keep is None else self.filename(keep)
+        for _, size, filename in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all cached matrices."""
+        for filename in glob.glob(os.path.join(self.path, "*.npy")):
+            os.remove(filename)
+
+    @property
+    def nbytes(self):
+        """Total size of the cached files."""
+        return sum(os.path.getsize(f)
+                   for f in glob.glob(os.path.join(self.path, "*.npy")))
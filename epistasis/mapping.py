@@ -7,6 +7,8 @@
 # ----------------------------------------------------------
 
 import json
+import struct
+import zipfile
 import itertools as it
 from functools import wraps
 from collections import OrderedDict
@@ -19,6 +21,10 @@ import pandas as pd
 # ----------------------------------------------------------
 
 import gpmap
+from .matrix import (SiteTable,
+                     pack_genotype_sets,
+                     site_support,
+                     BLOCK_SIZE)
 
 
 def assert_epistasis(method):
@@ -83,63 +89,572 @@ def mutations_to_sites(order, mutations, start_order=0):
 
     Returns
     -------
-    sites : list
-        list of all interaction sites for system with
-        sequences of a given length and epistasis with given order.
+    sites : SiteTable
+        all interaction sites for system with sequences of a given length
+        and epistasis with given order, as a padded table (see
+        epistasis.matrix.SiteTable). Use SiteSpace to count or index the
+        sites without building the table.
     """
-    # Convert a mutations mapping dictionary to a site mapping dictionary
-    sitemap = dict()
-    n_sites = 1
-    for m in mutations:
-        if mutations[m] is None:
-            sitemap[m] = None
-        else:
-            sitemap[m] = list(range(n_sites, n_sites + len(mutations[m]) - 1))
-            n_sites += len(mutations[m]) - 1
-
-    # Include the intercept interaction?
-    if start_order == 0:
-        sites = [[0]]
-        orders = range(1, order + 1)
-    else:
-        sites = list()
-        orders = range(start_order, order + 1)
-
-    length = len(sitemap)
-    # Recursive algorithm that's difficult to follow.
-
-    # Iterate through each order
-    for o in orders:
-        # Iterate through all combinations of orders with given length
-        for term in it.combinations(range(length), o):
-            # If any sites in `term` == None, skip this term.
-            bad_term = False
-            lists = []
-            for i in range(len(term)):
-                if sitemap[term[i]] is None:
-                    bad_term = True
+    return SiteSpace(order, mutations, start_order=start_order).to_table()
+
+
+def _expand_terms(terms, first, n_states):
+    """Expand combinations of positions into interaction sites.
+
+    Each combination expands to the product of its positions' sites, with
+    the last position varying fastest.
+
+    Parameters
+    ----------
+    terms : array
+        2d array of position indices, one combination per row.
+
+    first : array
+        first site number of each position.
+
+    n_states : array
+        number of sites (non-wildtype letters) of each position.
+
+    Returns
+    -------
+    table : array
+        2d int32 array of sites, one interaction per row.
+    """
+    n_terms = len(terms)
+    counts = n_states[terms]
+    strides = np.cumprod(counts[:, ::-1], axis=1)[:, ::-1]
+    n_products = strides[:, 0]
+    rows = np.repeat(np.arange(n_terms), n_products)
+    offsets = np.arange(len(rows)) - np.repeat(
+        np.cumsum(n_products) - n_products, n_products)
+    strides = np.append(strides[:, 1:], np.ones((n_terms, 1), dtype=int),
+                        axis=1)
+    digits = (offsets[:, None] // strides[rows]) % counts[rows]
+    return (first[terms[rows]] + digits).astype(np.int32)
+
+
+class SiteSpace(object):
+    """Lazy sequence of the interaction sites up to a given order.
+
+    The sites are the same, in the same order, as mutations_to_sites, but
+    are not built up front. The number of sites of each order is computed in
+    closed form, single sites are computed from their index, and the sites
+    can be generated in blocks. Models can use a SiteSpace for their X
+    columns; the matrix builders read it as a compact site table.
+
+    Parameters
+    ----------
+    order : int
+        order of interactions
+    mutations  : dict
+        `mutations = { site_number : ["mutation-1", "mutation-2"] }`.
+    start_order : int
+        lowest order of interactions. The intercept, [0], is included if
+        start_order is 0.
+    """
+    def __init__(self, order, mutations, start_order=0):
+        self.order = order
+        self.start_order = start_order
+        self._table = None
+
+        # Number of sites of each position and the first site number, in
+        # the order of the mutations mapping dictionary.
+        first, n_states = {}, {}
+        n_sites = 1
+        for m in mutations:
+            if mutations[m] is None:
+                n_states[m] = 0
+            else:
+                first[m] = n_sites
+                n_states[m] = len(mutations[m]) - 1
+                n_sites += n_states[m]
+
+        # Positions with at least one mutation
+        positions = [p for p in range(len(mutations)) if n_states[p] > 0]
+        self._first = np.array([first[p] for p in positions], dtype=np.int32)
+        self._n_states = np.array([n_states[p] for p in positions],
+                                  dtype=np.int32)
+
+        # Number of combinations of k positions from positions i onward,
+        # weighted by their number of sites, i.e. the elementary symmetric
+        # polynomials of n_states[i:]. Python ints, so counts don't overflow.
+        n = [int(x) for x in self._n_states]
+        suffix = [[1] + [0] * max(order, 0)]
+        for i in reversed(range(len(n))):
+            last = suffix[-1]
+            suffix.append([1] + [last[k] + n[i] * last[k - 1]
+                                 for k in range(1, len(last))])
+        self._suffix = suffix[::-1]
+
+    @property
+    def orders(self):
+        """Orders of interaction in the space."""
+        return list(range(max(self.start_order, 1), self.order + 1))
+
+    @property
+    def counts(self):
+        """Number of sites of each order, as a dict. The intercept is order
+        0."""
+        counts = {}
+        if self.start_order == 0:
+            counts[0] = 1
+        for o in self.orders:
+            counts[o] = self._suffix[0][o]
+        return counts
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def nbytes(self, n_genotypes, dtype=np.int8):
+        """Size of the model matrix for n_genotypes, in bytes."""
+        return n_genotypes * len(self) * np.dtype(dtype).itemsize
+
+    def _unrank(self, order, rank):
+        """Get the site with the given index among sites of one order."""
+        n, suffix = self._n_states, self._suffix
+        positions, remainders = [], []
+        i = 0
+        for k in range(order, 0, -1):
+            # Find the first position of the combination.
+            p = i
+            while True:
+                count = int(n[p]) * suffix[p + 1][k - 1]
+                if rank < count:
                     break
-                else:
-                    lists.append(sitemap[term[i]])
-            # Else, add interactions combinations to list
-            if bad_term is False:
-                for r in it.product(*lists):
-                    sites.append(list(r))
+                rank -= count
+                p += 1
+            positions.append(p)
+
+            # Index among the sites of the remaining positions.
+            if k > 1:
+                rank, remainder = divmod(rank, int(n[p]))
+                remainders.append(remainder)
+            i = p + 1
+
+        # Index among the products of the combination's sites.
+        product = rank
+        for p, remainder in zip(reversed(positions[:-1]),
+                                reversed(remainders)):
+            product = int(n[p]) * product + remainder
+
+        site = []
+        for p in reversed(positions):
+            product, digit = divmod(product, int(n[p]))
+            site.append(int(self._first[p]) + digit)
+        return site[::-1]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            index = int(key)
+            if index < 0:
+                index += len(self)
+            if index < 0 or index >= len(self):
+                raise IndexError("site index out of range")
+            for order, count in self.counts.items():
+                if index < count:
+                    return [0] if order == 0 else self._unrank(order, index)
+                index -= count
+        return self.to_table()[key]
+
+    def __iter__(self):
+        for block in self.blocks():
+            for site in block:
+                yield site
+
+    def __eq__(self, other):
+        return self.to_table() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return self.to_table() + other
+
+    def __radd__(self, other):
+        return other + self.to_table()
+
+    def __repr__(self):
+        return "SiteSpace(order={}, start_order={}, n={})".format(
+            self.order, self.start_order, len(self))
+
+    def blocks(self, block_size=2**16):
+        """Generate the sites in blocks.
+
+        Yields
+        ------
+        block : SiteTable
+            about block_size consecutive sites (blocks end at the end of
+            each order).
+        """
+        if self.start_order == 0:
+            yield SiteTable(np.zeros((1, 1), dtype=np.int32), [1])
+
+        n_positions = len(self._n_states)
+        max_states = int(self._n_states.max(initial=1))
+        for o in self.orders:
+            # Combinations per block, so the expanded block stays near
+            # block_size sites.
+            n_combinations = max(1, block_size // max_states**o)
+            combinations = it.combinations(range(n_positions), o)
+            while True:
+                terms = np.fromiter(
+                    it.chain.from_iterable(
+                        it.islice(combinations, n_combinations)),
+                    dtype=np.int32).reshape(-1, o)
+                if len(terms) == 0:
+                    break
+                table = _expand_terms(terms, self._first, self._n_states)
+                yield SiteTable(table, np.full(len(table), o, dtype=np.int32))
+
+    def to_table(self):
+        """Build all sites as a SiteTable. The table is built once and
+        stored."""
+        if self._table is None:
+            table = np.zeros((len(self), max(self.order, 1)), dtype=np.int32)
+            orders = np.zeros(len(self), dtype=np.int32)
+            i = 0
+            for block in self.blocks():
+                table[i:i + len(block), :block.width] = block.table
+                orders[i:i + len(block)] = block.orders
+                i += len(block)
+            self._table = SiteTable(table, orders)
+        return self._table
+
+
+def supported_sites(order, mutations, binary_genotypes, min_support=1):
+    """Build the interaction sites up to nth order that are carried by at
+    least min_support genotypes.
+
+    A site is kept if at least min_support genotypes carry all of its
+    mutations. Support can only drop as sites are added to an interaction,
+    so sites of each order are built by extending the kept sites of the
+    order below, and unsupported branches of the combinatorial space are
+    never enumerated. Support is counted by intersecting bitsets of the
+    genotypes carrying each mutation (see epistasis.matrix.site_support).
+
+    Parameters
+    ----------
+    order : int
+        order of interactions
+    mutations  : dict
+        `mutations = { site_number : ["mutation-1", "mutation-2"] }`.
+    binary_genotypes : list or array
+        genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+    min_support : int
+        minimum number of genotypes carrying a site.
+
+    Returns
+    -------
+    sites : SiteTable
+        the intercept and the supported sites, ordered by order, then
+        lexicographically.
+    """
+    singles = SiteSpace(1, mutations, start_order=1)
+    sets = pack_genotype_sets(binary_genotypes)
+
+    # Position of each site. Sites of the same position never co-occur.
+    position = np.repeat(np.arange(len(singles._n_states)), singles._n_states)
+
+    singles = singles.to_table().table[:, 0]
+    support = site_support(sets, SiteTable(singles[:, None],
+                                           np.ones(len(singles), np.int32)))
+    singles = singles[support >= min_support]
+
+    tables = [np.zeros((1, 1), dtype=np.int32)]
+    previous = singles[:, None]
+    if order >= 1:
+        tables.append(previous)
+
+    for o in range(2, order + 1):
+        # Extend each kept site by every single site past its last one, a
+        # block of sites at a time.
+        block = max(1, BLOCK_SIZE // max(len(singles), 1))
+        kept = []
+        for start in range(0, len(previous), block):
+            terms = previous[start:start + block]
+            first = np.searchsorted(singles, terms[:, -1], side="right")
+            n_extensions = len(singles) - first
+            rows = np.repeat(np.arange(len(terms)), n_extensions)
+            extensions = (np.arange(len(rows)) + np.repeat(
+                first - np.cumsum(n_extensions) + n_extensions, n_extensions))
+            candidates = np.column_stack((terms[rows], singles[extensions]))
+            candidates = candidates[position[candidates[:, -1] - 1] !=
+                                    position[candidates[:, -2] - 1]]
+            support = site_support(sets, SiteTable(
+                candidates, np.full(len(candidates), o, dtype=np.int32)))
+            kept.append(candidates[support >= min_support])
+        previous = np.concatenate(kept) if kept else np.zeros((0, o), int)
+        tables.append(previous)
+
+    n = sum(len(t) for t in tables)
+    table = np.zeros((n, max(order, 1)), dtype=np.int32)
+    orders = np.zeros(n, dtype=np.int32)
+    i = 0
+    for t in tables:
+        table[i:i + len(t), :t.shape[1]] = t
+        orders[i:i + len(t)] = t.shape[1]
+        i += len(t)
+    return SiteTable(table, orders)
+
+
+def _read_npz(filename, mmap_mode=None):
+    """Read the arrays in a .npz file into a dictionary.
+
+    With mmap_mode, members stored without compression are memory mapped at
+    their offset in the archive; compressed members are read into memory.
+    """
+    if mmap_mode is None:
+        with np.load(filename, allow_pickle=False) as npz:
+            return {key: npz[key] for key in npz.files}
+
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as f:
+        for info in archive.infolist():
+            key = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[key] = np.load(archive.open(info), allow_pickle=False)
+                continue
+
+            # Skip the member's local header to the .npy data.
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if dtype.hasobject or shape == () or 0 in shape:
+                arrays[key] = np.load(archive.open(info), allow_pickle=False)
+            else:
+                arrays[key] = np.memmap(f.name, dtype=dtype, mode=mmap_mode,
+                                        offset=f.tell(), shape=shape,
+                                        order="F" if fortran else "C")
+    return arrays
+
+
+class SiteIndex(object):
+    """Sorted index from interaction sites to their positions.
+
+    Each site is keyed by its row of a padded site table, with the sites in
+    increasing order, so many sites are looked up at once with a binary
+    search. New sites are merged into the index without re-sorting it.
 
-    return sites
+    Parameters
+    ----------
+    sites : list or SiteTable
+        interaction sites, in position order.
+    """
+    def __init__(self, sites):
+        sites = SiteTable.from_sites(sites)
+        self._width = sites.width
+        self._n = 0
+        self._keys = np.zeros(0, dtype=self._key_dtype())
+        self._positions = np.zeros(0, dtype=np.int64)
+        self.add(sites)
+
+    def __len__(self):
+        return self._n
+
+    def _key_dtype(self):
+        # Big-endian fields sort rows lexicographically.
+        return np.dtype([("f{}".format(i), ">i4")
+                         for i in range(self._width)])
+
+    def _keys_of(self, sites):
+        """Keys of a list of sites, and a mask of sites that fit the
+        index."""
+        sites = SiteTable.from_sites(sites)
+        table = sites.table.astype(np.int64)
+        n, width = table.shape
+
+        # Sort the sites of each interaction, keeping padding at the end.
+        padding = np.arange(width) >= sites.orders[:, None]
+        table[padding] = np.iinfo(np.int64).max
+        table.sort(axis=1)
+        table[padding] = 0
+
+        # Pad or cut to the width of the index.
+        fits = sites.orders <= self._width
+        keys = np.zeros((n, self._width), dtype=">i4")
+        w = min(width, self._width)
+        keys[:, :w] = table[:, :w]
+        return keys.view(self._key_dtype()).ravel(), fits
+
+    def add(self, sites, start=None):
+        """Add sites at positions start, start + 1, ... (default: after the
+        sites already indexed)."""
+        if start is None:
+            start = self._n
+        sites = SiteTable.from_sites(sites)
+        if sites.width > self._width:
+            # Widen the existing keys; padding keeps them in order.
+            old = self._keys.view(">i4").reshape(len(self._keys), -1)
+            self._width = sites.width
+            keys = np.zeros((len(old), self._width), dtype=">i4")
+            keys[:, :old.shape[1]] = old
+            self._keys = keys.view(self._key_dtype()).ravel()
+
+        keys, _ = self._keys_of(sites)
+        columns = keys.view(">i4").reshape(len(keys), -1).astype(np.int32)
+        order = np.lexsort(columns.T[::-1])
+        keys = keys[order]
+        positions = start + order.astype(np.int64)
+
+        # Merge the sorted new keys into the sorted index.
+        at = np.searchsorted(self._keys, keys)
+        self._keys = np.insert(self._keys, at, keys)
+        self._positions = np.insert(self._positions, at, positions)
+        self._n = max(self._n, start + len(sites))
+
+    def lookup(self, sites):
+        """Positions of many sites. Sites not in the index are -1."""
+        keys, fits = self._keys_of(sites)
+        if len(self._keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        at = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = fits & (self._keys[at] == keys)
+        return np.where(found, self._positions[at], -1)
+
+
+class _ReadOnlyDataFrame(pd.DataFrame):
+    """DataFrame of an EpistasisMap, built on request. Its arrays are
+    read-only and setting a column raises, since writes would not reach the
+    map. Frames derived from it (e.g. ``copy()``) are plain DataFrames."""
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def __setitem__(self, key, value):
+        raise Exception("EpistasisMap.data is read-only; set the map's "
+                        "values instead, or use data.copy().")
 
 
 class EpistasisMap(object):
-    """DataFrame for epistatic interactions.
+    """Epistatic interactions, stored as arrays.
+
+    Sites are stored in a SiteTable (see epistasis.matrix.SiteTable) and
+    values in a float array. Terms are usually grouped by order; the start
+    of each order is computed once, so ``get_orders`` returns views of the
+    arrays. ``data`` builds a DataFrame of the map on request.
+
+    Maps of a SiteSpace keep the space and only build its site table when
+    ``sites`` (or something that needs every site) is read.
+
+    Maps of several traits measured on the same genotypes store values as a
+    2d array of traits x terms; ``table`` gives it as a DataFrame.
     """
-    def __init__(self, sites, order=1, values=None, model_type="global"):
+    def __init__(self, sites, order=1, values=None, model_type="global",
+                 traits=None):
         self.order = order
         self.model_type = model_type
-        data = {
-            'sites': sites,
-            'values': values,
-        }
-        self.data = pd.DataFrame(data)
+        self._traits = None
+        if isinstance(sites, SiteSpace):
+            self._space = sites
+            self._sites = None
+            self._orders = None
+        else:
+            self._space = None
+            self._sites = SiteTable.from_sites(sites)
+
+            # Order of each term; the intercept, [0], is order 0.
+            orders = self._sites.orders.copy()
+            orders[self._sites.table[:, 0] == 0] = 0
+            self._orders = orders
+
+        self._set_offsets()
+        self._site_index = None
+        self.values = values
+        self.traits = traits
+
+    def _set_offsets(self):
+        """Offsets of each order, if terms are grouped by order."""
+        if self._orders is None:
+            # Sites of a SiteSpace are grouped by order.
+            counts = self._space.counts
+            ends = [sum(n for o, n in counts.items() if o < k)
+                    for k in range(max(counts, default=0) + 2)]
+            self._offsets = np.array(ends, dtype=np.int64)
+            return
+        orders = self._orders
+        if np.all(orders[1:] >= orders[:-1]):
+            self._offsets = np.searchsorted(
+                orders, np.arange(orders.max(initial=0) + 2))
+        else:
+            self._offsets = None
+
+    def extend(self, sites, values=None):
+        """Append interactions to the map.
+
+        The site index, if built, is updated rather than rebuilt.
+        """
+        sites = SiteTable.from_sites(sites)
+        shape = self._values.shape[:-1] + (len(sites),)
+        if values is None:
+            values = np.full(shape, np.nan)
+        values = np.asarray(values, dtype=float)
+        if values.shape != shape:
+            raise Exception("values must have one element per site "
+                            "(and trait).")
+
+        start = self.n
+        orders = sites.orders.copy()
+        orders[sites.table[:, 0] == 0] = 0
+        self._sites = self.sites + sites
+        self._orders = np.concatenate((self.orders, orders))
+        self._space = None
+        self._values = np.concatenate((self._values, values), axis=-1)
+        self._set_offsets()
+        if self._site_index is not None:
+            self._site_index.add(sites, start=start)
+        return self
+
+    @property
+    def site_index(self):
+        """Index from sites to their positions in the map (see SiteIndex).
+        Built on first use."""
+        if self._site_index is None:
+            self._site_index = SiteIndex(self.sites)
+        return self._site_index
+
+    def index_of(self, sites):
+        """Positions of interactions in the map.
+
+        Parameters
+        ----------
+        sites : list, SiteTable, or str
+            a site (e.g. [1, 4, 7]) or key (e.g. "1,4,7"), or a list of
+            sites or keys.
+
+        Returns
+        -------
+        index : int or ndarray
+            position of each site; -1 if the site is not in the map.
+        """
+        single = isinstance(sites, str) or (
+            isinstance(sites, (list, tuple)) and len(sites) > 0 and
+            isinstance(sites[0], (int, np.integer)))
+        if single:
+            sites = [sites]
+        if not isinstance(sites, SiteTable):
+            sites = [key_to_site(s) if isinstance(s, str) else s
+                     for s in sites]
+        index = self.site_index.lookup(sites)
+        return int(index[0]) if single else index
+
+    def get_values(self, sites):
+        """Values of interactions in the map (see index_of). Sites not in
+        the map are NaN. Maps of several traits return a value per trait."""
+        index = self.index_of(sites)
+        values = np.where(index >= 0, self._values[..., index], np.nan)
+        return float(values) if np.ndim(values) == 0 else values
 
     def map(self, attr1, attr2):
         """Dictionary that maps attr1 to attr2."""
@@ -154,10 +669,80 @@ class EpistasisMap(object):
         self = cls(sites, order=order, values=values, model_type=model_type)
         return self
 
+    @property
+    def data(self):
+        """DataFrame of the sites and values. Maps of several traits have a
+        column of values per trait.
+
+        The DataFrame is built on each access and is read-only: set values
+        through ``values`` (or ``get_orders``), or use ``data.copy()``.
+        """
+        values = self._values.view()
+        values.flags.writeable = False
+        if values.ndim == 1:
+            data = pd.DataFrame({'values': values}, copy=False)
+        else:
+            data = pd.DataFrame(values.T, columns=self.traits, copy=False)
+        data.insert(0, 'sites', self.sites.tolist())
+        return _ReadOnlyDataFrame(data, copy=False)
+
+    @property
+    def table(self):
+        """DataFrame of values, traits x terms. Columns are site keys (see
+        site_to_key)."""
+        values = np.atleast_2d(self._values)
+        return pd.DataFrame(values, index=self.traits,
+                            columns=[site_to_key(s) for s in self.sites])
+
     def to_dict(self):
         """Get data as dictionary."""
         return self.data.to_dict('list')
 
+    def to_npz(self, filename, compress=False):
+        """Write the map to a numpy .npz file.
+
+        The values, site table and orders are stored as binary arrays. Maps
+        written without compression can be read back as memory maps (see
+        read_npz).
+        """
+        save = np.savez_compressed if compress else np.savez
+        extra = {}
+        if self._traits is not None:
+            extra["traits"] = np.array([str(t) for t in self._traits])
+        save(filename,
+             values=self._values,
+             site_table=self.sites.table,
+             site_orders=self.sites.orders,
+             order=np.array(self.order),
+             model_type=np.array(self.model_type),
+             **extra)
+
+    @classmethod
+    def read_npz(cls, filename, mmap_mode=None):
+        """Read a map written by to_npz.
+
+        Parameters
+        ----------
+        filename : str
+            path to the .npz file.
+
+        mmap_mode : str (default=None)
+            if given (e.g. 'r'), the values and site table are memory maps of
+            the file instead of copies in memory (see numpy.memmap). Requires
+            a file written without compression.
+        """
+        arrays = _read_npz(filename, mmap_mode=mmap_mode)
+        sites = SiteTable(arrays["site_table"], arrays["site_orders"])
+        self = cls(sites, order=int(arrays["order"]),
+                   model_type=str(arrays["model_type"]))
+        values = arrays["values"]
+        if values.ndim not in (1, 2) or values.shape[-1] != self.n:
+            raise Exception("values must have one element per site.")
+        self._values = values
+        if "traits" in arrays:
+            self.traits = arrays["traits"].tolist()
+        return self
+
     def to_csv(self, filename):
         """Write data to a csv file."""
         self.data.to_csv(filename)
@@ -174,7 +759,9 @@ class EpistasisMap(object):
     @property
     def n(self):
         """ Return the number of Interactions. """
-        return len(self.data.sites)
+        if self._sites is None:
+            return len(self._space)
+        return len(self._sites)
 
     @property
     def order(self):
@@ -183,21 +770,47 @@ class EpistasisMap(object):
 
     @property
     def values(self):
-        """ Get the values of the interaction in the system"""
-        return self.data['values'].values
+        """ Get the values of the interaction in the system. 1d, or traits x
+        terms for maps of several traits."""
+        return self._values
+
+    @property
+    def n_traits(self):
+        """Number of traits; 1 for maps with 1d values."""
+        return 1 if self._values.ndim == 1 else self._values.shape[0]
+
+    @property
+    def traits(self):
+        """Labels of traits (rows of ``table``). Defaults to 0, 1, ..."""
+        if self._traits is None:
+            return list(range(self.n_traits))
+        return self._traits
 
     @property
     def index(self):
         """ Get the interaction index in interaction matrix. """
-        return self.data.index
+        return pd.RangeIndex(self.n)
 
     @property
     def sites(self):
         """ Get the interaction sites, which describe the position of
-        interacting mutations in the genotypes. (type==list of lists,
-        see self._build_interaction_sites)
+        interacting mutations in the genotypes. (type==SiteTable, see
+        epistasis.matrix.SiteTable). Maps of a SiteSpace build the table
+        on first use.
         """
-        return self.data.sites.values
+        if self._sites is None:
+            self._sites = self._space.to_table()
+        return self._sites
+
+    @property
+    def orders(self):
+        """Order of each interaction. The intercept is order 0."""
+        if self._orders is None:
+            counts = self._space.counts
+            orders = sorted(counts)
+            self._orders = np.repeat(np.array(orders, dtype=np.int32),
+                                     [counts[o] for o in orders])
+        return self._orders
 
     def get_orders(self, *orders):
         """Get epistasis of a given order."""
@@ -214,8 +827,28 @@ class EpistasisMap(object):
 
     @values.setter
     def values(self, values):
-        """ Manually set keys. NEED TO do some quality control here. """
-        self.data.values = values
+        """Set the values of the interactions: an array of one value per
+        term, or a 2d array of traits x terms. None sets all values to
+        NaN."""
+        if values is None:
+            values = np.full(self.n, np.nan)
+        values = np.array(values, dtype=float)
+        if values.ndim not in (1, 2) or values.shape[-1] != self.n:
+            raise Exception("values must have one element per site.")
+        self._values = values
+
+        # Drop labels that no longer match the traits.
+        if self._traits is not None and len(self._traits) != self.n_traits:
+            self._traits = None
+
+    @traits.setter
+    def traits(self, traits):
+        if traits is not None:
+            traits = list(traits)
+            if len(traits) != self.n_traits:
+                raise Exception("traits must have one label per row of "
+                                "values.")
+        self._traits = traits
 
     @model_type.setter
     def model_type(self, model_type):
@@ -228,12 +861,33 @@ class EpistasisMap(object):
 class Orders(map):
     """An object that provides API for easily calling epistasis of a given order
     in an epistasis map.
+
+    ``sites`` and ``values`` are pandas Series indexed by the terms' index
+    in the map. If the orders are consecutive and the map's terms are
+    grouped by order, ``values`` is a view of the map's values. Maps of
+    several traits give ``values`` as a DataFrame of traits x terms.
     """
 
     def __init__(self, epistasismap, orders):
         self._epistasismap = epistasismap
         self.orders = orders
 
+        # Check is multiple orders were given
+        try:
+            orders = sorted(iter(orders))
+        except TypeError:
+            orders = [orders]
+
+        # Terms of consecutive orders are a slice of a grouped map.
+        offsets = epistasismap._offsets
+        if (offsets is not None and len(orders) > 0 and
+                orders == list(range(orders[0], orders[-1] + 1))):
+            start = offsets[min(orders[0], len(offsets) - 1)]
+            stop = offsets[min(orders[-1] + 1, len(offsets) - 1)]
+            self._index = slice(int(start), int(stop))
+        else:
+            self._index = np.nonzero(np.isin(epistasismap.orders, orders))[0]
+
     def __call__(self):
         """return a dictionary"""
         return dict(zip(self.keys, self.values))
@@ -241,33 +895,33 @@ class Orders(map):
     @property
     def df(self):
         """Dataframe for orders object."""
-        data = {"sites": self.sites, "values": self.values,
-                "stdeviations": self.stdeviations}
-        return pd.DataFrame(data, columns=["sites", "values", "stdeviations"])
+        data = {"sites": self.sites}
+        values = self.values
+        if values.ndim == 1:
+            data["values"] = values
+        else:
+            for trait, v in values.iterrows():
+                data[trait] = v
+        return pd.DataFrame(data, index=self.index)
 
     @property
     def index(self):
         """Get indices of epistasis from this order."""
-        # Check is multiple orders were given
-        try:
-            orders = list(iter(self.orders))
-        except TypeError:
-            orders = [self.orders]
-        sites = self._epistasismap.sites
-        x = [i for i in range(1, len(sites)) if len(sites[i]) in orders]
-        # Add the zeroth element if included
-        if 0 in orders:
-            x = [0] + x
-        return np.array(x)
+        if isinstance(self._index, slice):
+            return np.arange(self._index.start, self._index.stop)
+        return self._index
 
     @property
     def sites(self):
         """Get epistatic sites"""
-        return pd.Series([self._epistasismap.sites[int(i)]
-                          for i in self.index], index=self.index)
+        sites = self._epistasismap.sites[self._index]
+        return pd.Series(sites.tolist(), index=self.index)
 
     @property
     def values(self):
         """Get values of epistasis for this order."""
-        return pd.Series([self._epistasismap.values[int(i)]
-                          for i in self.index], index=self.index)
+        values = self._epistasismap.values[..., self._index]
+        if values.ndim == 1:
+            return pd.Series(values, index=self.index, copy=False)
+        return pd.DataFrame(values, index=self._epistasismap.traits,
+                            columns=self.index, copy=False)
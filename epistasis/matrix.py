@@ -1,5 +1,168 @@
+import itertools as it
+
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator
+
+# Model matrix elements are -1, 0, or 1.
+DTYPE = np.int8
+
+# Number of matrix elements computed at a time by the numpy builder.
+BLOCK_SIZE = 2**20
+
+
+class SiteTable(object):
+    """Compact, list-like container of interaction sites.
+
+    Sites are stored as a padded int32 table and a vector of orders instead
+    of a list of lists. Indexing with an integer returns the site as a list;
+    indexing with a slice or an array of indices returns a new SiteTable.
+
+    Parameters
+    ----------
+    table : array
+        int32 array with one row per site. Row ``j`` holds the sites of
+        interaction ``j``, padded with zeros.
+
+    orders : array
+        int32 array with the order (number of sites) of each interaction.
+    """
+    def __init__(self, table, orders):
+        self.table = np.ascontiguousarray(table, dtype=np.int32)
+        self.orders = np.ascontiguousarray(orders, dtype=np.int32)
+        if self.table.ndim != 2 or len(self.table) != len(self.orders):
+            raise Exception("table must be 2d with one row per order.")
+
+    @classmethod
+    def from_sites(cls, sites):
+        """Build a SiteTable from a list of sites. SiteTables are returned
+        as they are."""
+        if isinstance(sites, cls):
+            return sites
+        # Lazy sequences of sites (see epistasis.mapping.SiteSpace)
+        if hasattr(sites, "to_table"):
+            return sites.to_table()
+        sites = list(sites)
+        orders = np.array([len(s) for s in sites], dtype=np.int32)
+        width = max(orders.max(initial=0), 1)
+        table = np.zeros((len(sites), width), dtype=np.int32)
+        for j, site in enumerate(sites):
+            table[j, :orders[j]] = site
+        return cls(table, orders)
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.table[key, :self.orders[key]].tolist()
+        # Slices of rows are views of the table.
+        return SiteTable(self.table[key], self.orders[key])
+
+    def __iter__(self):
+        for row, order in zip(self.table.tolist(), self.orders.tolist()):
+            yield row[:order]
+
+    def __add__(self, other):
+        other = SiteTable.from_sites(other)
+        width = max(self.width, other.width)
+        table = np.zeros((len(self) + len(other), width), dtype=np.int32)
+        table[:len(self), :self.width] = self.table
+        table[len(self):, :other.width] = other.table
+        return SiteTable(table, np.concatenate((self.orders, other.orders)))
+
+    def __radd__(self, other):
+        return SiteTable.from_sites(other) + self
+
+    def __eq__(self, other):
+        try:
+            other = SiteTable.from_sites(other)
+        except TypeError:
+            return NotImplemented
+        width = min(self.width, other.width)
+        return (np.array_equal(self.orders, other.orders) and
+                np.array_equal(self.table[:, :width], other.table[:, :width]))
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "SiteTable({})".format(self.tolist())
+
+    @property
+    def width(self):
+        """Number of columns in the padded table."""
+        return self.table.shape[1]
+
+    @property
+    def max_order(self):
+        """Highest order of the sites."""
+        return int(self.orders.max(initial=0))
+
+    def tolist(self):
+        """Sites as a list of lists."""
+        return list(self)
+
+
+def sites_to_table(sites):
+    """Convert a list of interaction sites to a padded table.
+
+    Parameters
+    ----------
+    sites : list or SiteTable
+        List of epistatic interaction sites.
+
+    Returns
+    -------
+    site_table : ndarray
+        int32 array with one row per site. Row ``j`` holds the sites of
+        interaction ``j``, padded with zeros.
+
+    site_orders : ndarray
+        int32 array with the order (number of sites) of each interaction.
+    """
+    sites = SiteTable.from_sites(sites)
+    return sites.table, sites.orders
+
+
+def _build_model_matrix(encoding_vectors, site_table, site_orders,
+                        n_threads=1):
+    """Build model matrix with numpy.
+
+    Columns are grouped by interaction order. Each group is computed as the
+    product of whole columns gathered from the encoding vectors, one block of
+    rows at a time, so no Python code runs per matrix element. n_threads is
+    accepted for compatibility with the cython builder and ignored.
+    """
+    encoding_vectors = np.asarray(encoding_vectors)
+
+    # get dimensions of matrix
+    n, m = len(encoding_vectors), len(site_table)
+    matrix = np.ones((n, m), dtype=DTYPE)
+
+    # Group columns by interaction order as 2d tables of sites.
+    groups = []
+    for order in np.unique(site_orders):
+        columns = np.nonzero(site_orders == order)[0]
+        groups.append((columns, site_table[columns, :order]))
+
+    # Iterate over blocks of rows.
+    step = max(1, BLOCK_SIZE // max(m, 1))
+    for start in range(0, n, step):
+        vecs = encoding_vectors[start:start + step]
+        for columns, table in groups:
+            # Multiply the gathered columns for each site in the interaction.
+            element = vecs[:, table[:, 0]]
+            for k in range(1, table.shape[1]):
+                element *= vecs[:, table[:, k]]
+            matrix[start:start + step, columns] = element
+
+    return matrix
+
 
 # Try importing model matrix builder from cython extension for speed up.
 try:
@@ -12,87 +175,865 @@ except ImportError:
     # Raise warning
     _warnings.warn('Could not load cython extension, "build_model_matrix".', Warning)
 
-    def build_model_matrix(encoding_vectors, sites):
-        """Build model matrix.
+    build_model_matrix = _build_model_matrix
 
-        This can be made faster by cython.
-        """
-        # get dimensions of matrix
-        n, m = len(encoding_vectors), len(sites)
 
-        matrix = np.ones((n,m), dtype=int)
+def genotypes_to_array(genotypes):
+    """View a list of genotypes as a 2d uint8 array of character codes.
 
-        # Interate over rows
-        for i in range(n):
-            vec = encoding_vectors[i]
+    The genotypes are converted to a fixed-width numpy string array in one
+    call and its buffer is reinterpreted as character codes, so no Python
+    code runs per genotype.
 
-            # Iterate over cols
-            for j in range(m):
-                # Get sites in this coefficient column
-                players = sites[j]
+    Parameters
+    ----------
+    genotypes : list or array
+        List of genotypes, all the same length.
 
-                # Multiply these elements
-                matrix[i,j] = np.prod(vec[players])
+    Returns
+    -------
+    codes : ndarray
+        uint8 array with shape (number of genotypes, length of genotypes).
+    """
+    genotypes = np.asarray(genotypes)
+    if genotypes.dtype.kind not in "US":
+        genotypes = genotypes.astype(str)
+    genotypes = np.ascontiguousarray(genotypes).ravel()
 
-        return matrix
+    n = len(genotypes)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+
+    if genotypes.dtype.kind == "S":
+        codes = genotypes.view(np.uint8).reshape(n, -1)
+    else:
+        codes = genotypes.view(np.uint32).reshape(n, -1)
+        if codes.max(initial=0) > 127:
+            raise Exception("Genotypes must be ASCII strings.")
+        codes = codes.astype(np.uint8)
+
+    # Shorter strings are padded with null characters.
+    if codes.shape[1] > 0 and not codes[:, -1].all():
+        raise Exception("Genotypes are not all the same length.")
+    return codes
+
+
+def encode_genotypes(wildtype, genotypes, mutations):
+    """Get the binary representation of genotypes w.r.t. the wildtype.
+
+    Equivalent to gpmap.utils.genotypes_to_binary, but returns a 2d array of
+    0/1 values instead of a list of strings and is computed with whole-array
+    lookups.
+
+    Parameters
+    ----------
+    wildtype : str
+        wildtype sequence.
+
+    genotypes : list
+        List of genotypes to transform.
+
+    mutations : dict
+        mutations dictionary that maps sites to mutations.
+
+    Returns
+    -------
+    binary : ndarray
+        uint8 array with one row per genotype. Each mutated position
+        contributes one column per non-wildtype letter of its alphabet.
+    """
+    codes = genotypes_to_array(genotypes)
+    if len(codes) > 0 and codes.shape[1] != len(wildtype):
+        raise Exception("Wildtype is not the same length as genotypes.")
+    if len(mutations) != len(wildtype):
+        raise Exception("mutations dict is not the same length as genotypes.")
+
+    # Lookup table from each mutated position's letters to its state; the
+    # wildtype is state 0, and other letters count up in alphabet order.
+    positions, lookup = [], []
+    column_positions, column_states = [], []
+    for site in range(len(wildtype)):
+        alphabet = mutations[site]
+        if alphabet is None:
+            continue
+        if wildtype[site] not in alphabet:
+            raise Exception("Wildtype letter at site {} is not in its "
+                            "alphabet.".format(site))
+        others = [a for a in alphabet if a != wildtype[site]]
+        table = np.full(256, -1, dtype=np.int16)
+        table[ord(wildtype[site])] = 0
+        table[[ord(a) for a in others]] = np.arange(1, len(others) + 1)
+
+        # One column of the binary representation per non-wildtype letter.
+        column_positions += [len(positions)] * len(others)
+        column_states += range(1, len(others) + 1)
+        positions.append(site)
+        lookup.append(table)
+
+    if len(positions) == 0 or len(codes) == 0:
+        return np.zeros((len(codes), len(column_states)), dtype=np.uint8)
+
+    lookup = np.array(lookup)
+    states = lookup[np.arange(len(positions)), codes[:, positions]]
+    if (states < 0).any():
+        row, column = np.argwhere(states < 0)[0]
+        raise Exception("Genotype {} has a letter at site {} that is not in "
+                        "the mutations dictionary.".format(
+                            row, positions[column]))
+
+    binary = states[:, column_positions] == np.array(column_states)
+    return binary.view(np.uint8)
 
 
 def encode_vectors(binary_genotypes, model_type='global'):
     """Encode a set of binary genotypes is input vectors for the given model
 
+    The first element of each vector is 1 (the intercept). Mutated positions
+    are -1 (and wildtype 1) for global models, 1 (and wildtype 0) for local
+    models.
     """
-    # Initialize vector container
-    vectors = []
+    bits = _binary_to_bits(binary_genotypes)
+    vectors = np.ones((len(bits), bits.shape[1] + 1), dtype=float)
 
     # Handle a global model
     if model_type == 'global':
-
-        for i, genotype in enumerate(binary_genotypes):
-            vector = np.array([0] + list(genotype), dtype=float)
-            vector[vector==1] = -1
-            vector[vector==0] = 1
-            vectors.append(vector)
+        vectors[:, 1:] -= 2 * bits
 
     # Handle a local model.
     elif model_type == 'local':
-
-        for i, genotype in enumerate(binary_genotypes):
-            vector = np.array([1] + list(genotype), dtype=float)
-            vectors.append(vector)
+        vectors[:, 1:] = bits
 
     # Don't understand the model
     else:
-        Exception("Unrecognized model type.")
+        raise Exception("Unrecognized model type.")
 
-    return np.array(vectors)
+    return vectors
 
 
-def get_model_matrix(binary_genotypes, sites, model_type='global'):
+def get_model_matrix(binary_genotypes, sites, model_type='global',
+                     dtype=DTYPE, n_threads=1, cache=None):
     """Get a model matrix for a given set of genotypes and coefficients.
 
     Parameters
     ----------
     binary_genotypes : list or array
         List of genotypes in their binary representation (see
-        gpmap.utils.genotypes_to_binary)
+        gpmap.utils.genotypes_to_binary), or a 2d array of 0/1 values (see
+        encode_genotypes).
 
     sites : list
         List of epistatic interaction sites.
 
     model_type : string
         Type of epistasis model (global/Hadamard, local/Biochemical).
+
+    dtype : numpy dtype (default=numpy.int8)
+        data type of the matrix. Elements are -1, 0, or 1, so int8 is
+        exact; use a float type if the matrix is passed straight to BLAS.
+
+    n_threads : int (default=1)
+        number of threads used by the cython extension to build rows.
+
+    cache : ModelMatrixCache (default=None)
+        on-disk cache of model matrices (see epistasis.cache). If given, a
+        cached matrix is returned as a read-only memory map, and a newly
+        built matrix is written to the cache.
     """
-    # Convert sites to array of arrays
-    sites = np.array([np.array(s) for s in sites])
+    if cache is not None:
+        key = cache.key(binary_genotypes, sites, model_type=model_type,
+                        dtype=dtype)
+        X = cache.get(key)
+        if X is None:
+            X = get_model_matrix(binary_genotypes, sites,
+                                 model_type=model_type, dtype=dtype,
+                                 n_threads=n_threads)
+            X = cache.put(key, X)
+        return X
+
+    # Convert sites to a padded table
+    site_table, site_orders = sites_to_table(sites)
 
     # Encode genotypes
     encoded_vector = encode_vectors(binary_genotypes, model_type=model_type)
+    encoded_vector = np.ascontiguousarray(encoded_vector, dtype=float)
 
     # Build matrix.
-    X = build_model_matrix(encoded_vector, sites)
+    X = build_model_matrix(encoded_vector, site_table, site_orders,
+                           n_threads=n_threads)
+    if X.dtype != dtype:
+        X = X.astype(dtype)
+    return X
+
+
+def _binary_to_bits(binary_genotypes):
+    """View binary genotypes as a 2d uint8 array of 0/1 values.
+
+    Binary genotypes are either strings of 0s and 1s or arrays of 0/1
+    values (see encode_genotypes).
+    """
+    binary_genotypes = np.asarray(binary_genotypes)
+    if len(binary_genotypes) == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+    if binary_genotypes.dtype.kind in "USO":
+        return genotypes_to_array(binary_genotypes) - np.uint8(ord("0"))
+    return binary_genotypes.astype(np.uint8, copy=False).reshape(
+        len(binary_genotypes), -1)
+
+
+# Parity and number of the set bits in each byte.
+_PARITY_TABLE = np.array([bin(i).count("1") & 1 for i in range(256)],
+                         dtype=np.uint8)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)],
+                           dtype=np.uint8)
+
+
+def parity(a):
+    """Parity of the set bits in each element of an unsigned 64-bit array."""
+    a = np.asarray(a, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(a) & 1
+
+    # Fold the word onto its lowest byte, then look up the byte's parity.
+    folded = a ^ (a >> np.uint64(32))
+    folded ^= folded >> np.uint64(16)
+    folded ^= folded >> np.uint64(8)
+    return _PARITY_TABLE[(folded & np.uint64(255)).astype(np.uint8)]
+
+
+def popcount(a):
+    """Number of set bits in each element of an unsigned 64-bit array."""
+    a = np.ascontiguousarray(a, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(a)
+    counts = _POPCOUNT_TABLE[a.view(np.uint8)]
+    return counts.reshape(a.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _pack_words(bits):
+    """Pack rows of bits, a whole number of words long, into uint64 words.
+
+    Bit ``k`` of word ``w`` is column ``64 * w + k`` of the row.
+    """
+    n_rows, length = bits.shape
+    bits = bits.reshape(n_rows, length // 64, 64)
+    words = np.zeros((n_rows, length // 64), dtype=np.uint64)
+    for k in range(64):
+        words |= bits[:, :, k].astype(np.uint64) << np.uint64(k)
+    return words
+
+
+def pack_genotype_sets(binary_genotypes):
+    """Pack the set of genotypes carrying each mutation into 64-bit words.
+
+    Row ``k`` is the set of genotypes carrying site ``k``: bit ``i`` of word
+    ``w`` is set if genotype ``64 * w + i`` carries the mutation. Row 0, the
+    intercept, holds all genotypes.
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    Returns
+    -------
+    sets : ndarray
+        uint64 array with shape (number of sites + 1, number of words).
+    """
+    bits = _binary_to_bits(binary_genotypes)
+    n, length = bits.shape
+    n_words = max(1, -(-n // 64))
+
+    padded = np.zeros((length + 1, n_words * 64), dtype=np.uint8)
+    padded[0, :n] = 1
+    padded[1:, :n] = bits.T
+    return _pack_words(padded)
+
+
+def site_support(binary_genotypes, sites, max_bytes=BLOCK_SIZE):
+    """Count the genotypes carrying every mutation of each interaction.
+
+    Columns of a model matrix with no supporting genotype are zero (local
+    models) or aliased with lower-order columns (global models).
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation, or the packed
+        genotype sets (see pack_genotype_sets).
+
+    sites : list
+        List of epistatic interaction sites.
+
+    max_bytes : int
+        memory used for the intersections of a block of sites, in bytes.
+
+    Returns
+    -------
+    support : ndarray
+        int64 array with the number of supporting genotypes of each site.
+    """
+    if isinstance(binary_genotypes, np.ndarray) and \
+            binary_genotypes.dtype == np.uint64:
+        sets = binary_genotypes
+    else:
+        sets = pack_genotype_sets(binary_genotypes)
+    site_table, site_orders = sites_to_table(sites)
+
+    # Padding in the site table is 0, whose set holds all genotypes, so
+    # every row can intersect all of its columns.
+    n_words = sets.shape[1]
+    block = max(1, max_bytes // (8 * n_words))
+    support = np.empty(len(site_table), dtype=np.int64)
+    for start in range(0, len(site_table), block):
+        rows = site_table[start:start + block]
+        common = sets[rows[:, 0]]
+        for i in range(1, rows.shape[1]):
+            common &= sets[rows[:, i]]
+        support[start:start + block] = popcount(common).sum(axis=1)
+    return support
+
+
+def pack_binary(binary_genotypes):
+    """Pack binary genotypes into 64-bit words.
+
+    Bit ``k`` of word ``w`` is set if the genotype carries the mutation at
+    position ``64 * w + k`` of its binary representation (i.e. site
+    ``64 * w + k + 1``).
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    Returns
+    -------
+    packed : ndarray
+        uint64 array with shape (number of genotypes, number of words).
+    """
+    bits = _binary_to_bits(binary_genotypes)
+    n, length = bits.shape
+    n_words = max(1, -(-length // 64))
+
+    # Pad each genotype to a whole number of words.
+    padded = np.zeros((n, 64 * n_words), dtype=np.uint8)
+    padded[:, :length] = bits
+    return _pack_words(padded)
+
+
+def pack_sites(sites, n_words=1):
+    """Pack interaction sites into 64-bit masks.
+
+    Bit ``k - 1`` of the mask (counting across words) is set if site ``k``
+    is in the interaction. The intercept, ``[0]``, has an empty mask.
+
+    Parameters
+    ----------
+    sites : list
+        List of epistatic interaction sites.
+
+    n_words : int
+        number of 64-bit words per mask. Must match the packed genotypes.
+
+    Returns
+    -------
+    masks : ndarray
+        uint64 array with shape (number of sites, number of words).
+    """
+    site_table, site_orders = sites_to_table(sites)
+    masks = np.zeros((len(site_table), n_words), dtype=np.uint64)
+    for i in range(site_table.shape[1]):
+        rows = np.nonzero((site_orders > i) & (site_table[:, i] > 0))[0]
+        word, bit = np.divmod(site_table[rows, i].astype(np.int64) - 1, 64)
+        np.bitwise_or.at(masks, (rows, word),
+                         np.left_shift(np.uint64(1), bit.astype(np.uint64)))
+    return masks
+
+
+def build_packed_model_matrix(packed_genotypes, masks, model_type="global"):
+    """Build model matrix from packed genotypes and site masks.
+
+    Global (Hadamard) elements are ``(-1)^popcount(g & mask)`` and local
+    (biochemical) elements are ``(g & mask) == mask``. Elements are computed
+    one block of rows at a time.
+
+    Parameters
+    ----------
+    packed_genotypes : ndarray
+        packed genotypes (see pack_binary)
+
+    masks : ndarray
+        packed interaction sites (see pack_sites)
+
+    model_type : string
+        Type of epistasis model (global/Hadamard, local/Biochemical).
+
+    Returns
+    -------
+    matrix : ndarray
+        2d model matrix.
+    """
+    if model_type not in ["global", "local"]:
+        raise Exception("Unrecognized model type.")
+
+    n, m = len(packed_genotypes), len(masks)
+    n_words = masks.shape[1]
+    matrix = np.empty((n, m), dtype=DTYPE)
+
+    step = max(1, BLOCK_SIZE // max(m * n_words, 1))
+    for start in range(0, n, step):
+        g = packed_genotypes[start:start + step, None, :]
+        overlap = g & masks[None, :, :]
+
+        if model_type == "global":
+            # Parity of the mutations shared by genotype and site.
+            odd = parity(np.bitwise_xor.reduce(overlap, axis=-1))
+            element = 1 - 2 * odd.astype(DTYPE)
+        else:
+            # Genotype carries all mutations in site.
+            element = (overlap == masks[None, :, :]).all(axis=-1)
+
+        matrix[start:start + step] = element
+
+    return matrix
+
+
+class ModelMatrixOperator(LinearOperator):
+    """Epistasis model matrix as a scipy LinearOperator.
+
+    Products with the model matrix (``X.dot(thetas)``) and its transpose
+    (``X.T.dot(y)``) are computed on the fly from packed genotypes and site
+    masks, one block of rows at a time. The full matrix is never held in
+    memory.
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    sites : list
+        List of epistatic interaction sites.
+
+    model_type : string
+        Type of epistasis model (global/Hadamard, local/Biochemical).
+
+    block_size : int (default=None)
+        number of rows computed at a time. If None, set from BLOCK_SIZE.
+    """
+    def __init__(self, binary_genotypes, sites, model_type='global',
+                 block_size=None):
+        self.model_type = model_type
+        self.packed_genotypes = pack_binary(binary_genotypes)
+        self.masks = pack_sites(sites, n_words=self.packed_genotypes.shape[1])
+
+        n, m = len(self.packed_genotypes), len(self.masks)
+        if block_size is None:
+            block_size = max(1, BLOCK_SIZE // max(m, 1))
+        self.block_size = block_size
+        super(ModelMatrixOperator, self).__init__(dtype=float, shape=(n, m))
+
+    def blocks(self):
+        """Iterate over (row slice, model matrix block) pairs."""
+        n = self.shape[0]
+        for start in range(0, n, self.block_size):
+            rows = slice(start, min(start + self.block_size, n))
+            block = build_packed_model_matrix(
+                self.packed_genotypes[rows],
+                self.masks,
+                model_type=self.model_type)
+            yield rows, block
+
+    def toarray(self):
+        """Build the full model matrix."""
+        return build_packed_model_matrix(self.packed_genotypes, self.masks,
+                                         model_type=self.model_type)
+
+    def _matvec(self, x):
+        return self._matmat(x)
+
+    def _matmat(self, x):
+        out = np.empty((self.shape[0],) + x.shape[1:])
+        for rows, block in self.blocks():
+            out[rows] = block.dot(x)
+        return out
+
+    def _rmatvec(self, x):
+        return self._rmatmat(x)
+
+    def _rmatmat(self, x):
+        out = np.zeros((self.shape[1],) + x.shape[1:])
+        for rows, block in self.blocks():
+            out += block.T.dot(x[rows])
+        return out
+
+    def _transpose(self):
+        # Elements are real, so the transpose is also the adjoint.
+        return LinearOperator((self.shape[1], self.shape[0]), dtype=self.dtype,
+                              matvec=self._rmatvec, rmatvec=self._matvec,
+                              matmat=self._rmatmat)
+
+    _adjoint = _transpose
+
+
+def binary_to_index(binary_genotypes):
+    """Get the integer index of each binary genotype.
+
+    Bit ``i`` of the index is set if the genotype carries the mutation at
+    position ``i`` of its binary representation (i.e. site ``i + 1``).
+    """
+    bits = _binary_to_bits(binary_genotypes)
+    weights = np.left_shift(1, np.arange(bits.shape[1], dtype=np.int64))
+    return bits.dot(weights)
+
+
+def sites_to_index(sites):
+    """Get the integer index of each interaction site.
+
+    Bit ``k - 1`` of the index is set if site ``k`` is in the interaction.
+    The intercept, ``[0]``, has index 0.
+    """
+    site_table, site_orders = sites_to_table(sites)
+    index = np.zeros(len(site_table), dtype=np.int64)
+    for i in range(site_table.shape[1]):
+        column = site_table[:, i].astype(np.int64)
+        used = (site_orders > i) & (column > 0)
+        index[used] |= np.left_shift(1, column[used] - 1)
+    return index
+
+
+def get_complete_index(binary_genotypes, sites):
+    """Get row and column indices of a complete, full-order model matrix.
+
+    A set of binary genotypes of length L is complete if it contains all
+    2^L genotypes. Paired with all 2^L interaction sites, the model matrix
+    is square and can be inverted with a fast transform instead of a
+    least-squares solver.
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    sites : list
+        List of epistatic interaction sites.
+
+    Returns
+    -------
+    index : tuple or None
+        Tuple of ``(rows, columns)`` integer indices of the genotypes and
+        sites. None if the genotypes and sites are not complete.
+    """
+    n = len(binary_genotypes)
+    if n == 0 or n != len(sites):
+        return None
+
+    # Check that the number of genotypes is 2^L.
+    length = len(binary_genotypes[0])
+    if length > 62 or n != 2**length:
+        return None
+
+    rows = binary_to_index(binary_genotypes)
+    columns = sites_to_index(sites)
+
+    # Check for duplicate genotypes or sites.
+    if len(np.unique(rows)) != n or len(np.unique(columns)) != n:
+        return None
+
+    return rows, columns
+
+
+def walsh_hadamard_transform(a):
+    """Fast Walsh-Hadamard transform, computed in-place along the first axis.
+
+    The transform is unnormalized, i.e. applying it twice multiplies ``a`` by
+    its length. Element ``s`` of the output is
+    ``sum_g (-1)^popcount(g & s) a[g]``.
+
+    Parameters
+    ----------
+    a : ndarray
+        float array whose first dimension is a power of 2.
+
+    Returns
+    -------
+    a : ndarray
+        the transformed array.
+    """
+    n = len(a)
+    if n & (n - 1) != 0:
+        raise Exception("Length of array must be a power of 2.")
+
+    h = 1
+    while h < n:
+        # Pair elements whose indices differ only in the bit h.
+        view = a.reshape((n // (2 * h), 2, h) + a.shape[1:])
+        x, y = view[:, 0], view[:, 1]
+        tmp = x.copy()
+        x += y
+        y *= -1
+        y += tmp
+        h *= 2
+    return a
+
+
+def subset_sum_transform(a):
+    """Fast subset-sum (zeta) transform, computed in-place along the first
+    axis.
+
+    Element ``g`` of the output is the sum of ``a[s]`` over all ``s`` whose
+    bits are a subset of the bits in ``g``. This maps local (biochemical)
+    epistatic coefficients of a complete map to phenotypes.
+
+    Parameters
+    ----------
+    a : ndarray
+        float array whose first dimension is a power of 2.
+
+    Returns
+    -------
+    a : ndarray
+        the transformed array.
+    """
+    n = len(a)
+    if n & (n - 1) != 0:
+        raise Exception("Length of array must be a power of 2.")
+
+    h = 1
+    while h < n:
+        view = a.reshape((n // (2 * h), 2, h) + a.shape[1:])
+        view[:, 1] += view[:, 0]
+        h *= 2
+    return a
+
+
+def mobius_transform(a):
+    """Fast Mobius transform, computed in-place along the first axis.
+
+    Inverse of the subset-sum transform. This maps phenotypes of a complete
+    map to local (biochemical) epistatic coefficients.
+
+    Parameters
+    ----------
+    a : ndarray
+        float array whose first dimension is a power of 2.
+
+    Returns
+    -------
+    a : ndarray
+        the transformed array.
+    """
+    n = len(a)
+    if n & (n - 1) != 0:
+        raise Exception("Length of array must be a power of 2.")
+
+    h = 1
+    while h < n:
+        view = a.reshape((n // (2 * h), 2, h) + a.shape[1:])
+        view[:, 1] -= view[:, 0]
+        h *= 2
+    return a
+
+
+# Default size of blocks yielded by iter_model_matrix (128 MB).
+MAX_BYTES = 2**27
+
+
+def iter_model_matrix(binary_genotypes, sites, model_type='global',
+                      max_bytes=MAX_BYTES, dtype=DTYPE):
+    """Iterate over blocks of rows of a model matrix.
+
+    Genotypes are consumed lazily, so the full model matrix (or list of
+    genotypes) is never held in memory.
+
+    Parameters
+    ----------
+    binary_genotypes : iterable
+        Iterable of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    sites : list
+        List of epistatic interaction sites.
+
+    model_type : string
+        Type of epistasis model (global/Hadamard, local/Biochemical).
+
+    max_bytes : int
+        maximum size of each block of the model matrix, in bytes.
+
+    dtype : numpy dtype (default=numpy.int8)
+        data type of the matrix.
+
+    Yields
+    ------
+    rows : slice
+        rows of the full model matrix in this block.
+
+    X : ndarray
+        block of the model matrix.
+    """
+    site_table, site_orders = sites_to_table(sites)
+    row_bytes = max(len(sites) * np.dtype(dtype).itemsize, 1)
+    n_rows = max(1, max_bytes // row_bytes)
+
+    # Slice arrays; gather chunks from other iterables.
+    if isinstance(binary_genotypes, np.ndarray):
+        chunks = (binary_genotypes[i:i + n_rows]
+                  for i in range(0, len(binary_genotypes), n_rows))
+    else:
+        genotypes = iter(binary_genotypes)
+        chunks = iter(lambda: list(it.islice(genotypes, n_rows)), [])
+
+    start = 0
+    for chunk in chunks:
+
+        encoded_vector = encode_vectors(chunk, model_type=model_type)
+        encoded_vector = np.ascontiguousarray(encoded_vector, dtype=float)
+        X = build_model_matrix(encoded_vector, site_table, site_orders)
+        if X.dtype != dtype:
+            X = X.astype(dtype)
+
+        yield slice(start, start + len(chunk)), X
+        start += len(chunk)
+
+
+def extend_model_matrix(X, sites, new_sites):
+    """Append columns for new interaction sites to a model matrix.
+
+    The column of an interaction is the elementwise product of the column of
+    the interaction without its last site and the column of that last site,
+    so higher-order columns are computed from columns already in X rather
+    than from genotypes.
+
+    Parameters
+    ----------
+    X : ndarray or scipy.sparse matrix
+        model matrix whose columns correspond to sites.
+
+    sites : list
+        List of epistatic interaction sites in X. The lower-order parents and
+        first-order sites of every new site must be in sites or earlier in
+        new_sites.
+
+    new_sites : list
+        List of epistatic interaction sites to append, ordered by order.
+
+    Returns
+    -------
+    X : ndarray or scipy.sparse matrix
+        model matrix with columns for sites followed by new_sites.
+    """
+    columns = {tuple(site): j for j, site in enumerate(sites)}
+    is_sparse = sparse.issparse(X)
+    if is_sparse:
+        X = X.tocsc()
+
+    # Columns of each order are computed from the columns before them, so
+    # sites several orders above X find their parents among the new columns.
+    new_sites = [tuple(site) for site in new_sites]
+    start = 0
+    while start < len(new_sites):
+        stop = start
+        while (stop < len(new_sites) and
+               len(new_sites[stop]) == len(new_sites[start])):
+            stop += 1
+
+        parents, singles = [], []
+        for site in new_sites[start:stop]:
+            try:
+                parents.append(columns[site[:-1]])
+                singles.append(columns[site[-1:]])
+            except KeyError:
+                raise Exception("Lower-order sites of {} are not in the "
+                                "model matrix.".format(list(site)))
+
+        if is_sparse:
+            new = X[:, parents].multiply(X[:, singles])
+            X = sparse.hstack([X, new], format="csc")
+        else:
+            new = X[:, parents] * X[:, singles]
+            X = np.concatenate([X, new], axis=1)
+
+        for site in new_sites[start:stop]:
+            columns[site] = len(columns)
+        start = stop
+
+    if is_sparse:
+        return X.tocsr()
     return X
 
 
+def get_sparse_model_matrix(binary_genotypes, sites, model_type='local',
+                            dtype=DTYPE):
+    """Get a sparse (CSR) model matrix for a given set of genotypes and
+    coefficients.
+
+    Only local (biochemical) model matrices are sparse. Each row is built by
+    enumerating the interactions between the mutations carried by that
+    genotype, so memory scales with the number of nonzero elements rather
+    than genotypes times coefficients.
+
+    Parameters
+    ----------
+    binary_genotypes : list or array
+        List of genotypes in their binary representation (see
+        gpmap.utils.genotypes_to_binary)
+
+    sites : list
+        List of epistatic interaction sites.
+
+    model_type : string
+        Type of epistasis model. Must be 'local'.
+
+    dtype : numpy dtype (default=numpy.int8)
+        data type of the matrix.
+
+    Returns
+    -------
+    X : scipy.sparse.csr_matrix
+        sparse model matrix.
+    """
+    if model_type != 'local':
+        raise Exception("Sparse model matrices are only available for "
+                        "local models.")
+
+    # Map each interaction to its column.
+    columns = {tuple(sorted(int(k) for k in site)): j
+               for j, site in enumerate(sites)}
+    intercept = columns.get((0,))
+    max_order = max([len(site) for site in sites])
+
+    # Mutated sites (1-indexed) in each genotype.
+    bits = _binary_to_bits(binary_genotypes)
+    rows, positions = np.nonzero(bits)
+    counts = np.bincount(rows, minlength=len(bits))
+    mutations = np.split(positions + 1, np.cumsum(counts)[:-1])
+
+    indptr = np.zeros(len(bits) + 1, dtype=np.int64)
+    indices = []
+    for i, mutated in enumerate(mutations):
+        row = [] if intercept is None else [intercept]
+
+        # Interactions between mutations carried by this genotype.
+        mutated = mutated.tolist()
+        for order in range(1, min(max_order, len(mutated)) + 1):
+            for term in it.combinations(mutated, order):
+                j = columns.get(term)
+                if j is not None:
+                    row.append(j)
+
+        row.sort()
+        indices += row
+        indptr[i + 1] = indptr[i] + len(row)
+
+    indices = np.array(indices, dtype=np.int64)
+    data = np.ones(len(indices), dtype=dtype)
+    return sparse.csr_matrix((data, indices, indptr),
+                             shape=(len(bits), len(sites)))
+
+
 def get_pandas_matrix(
     binary_genotypes,
     sites,
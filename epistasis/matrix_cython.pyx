@@ -1,30 +1,54 @@
+# cython: boundscheck=False, wraparound=False, initializedcheck=False
 import numpy as np
 
-DTYPE = np.int
+from cython.parallel import prange
 
-cimport numpy as np
+DTYPE = np.int8
 
-ctypedef np.int_t DTYPE_t
 
-def build_model_matrix(np.ndarray encoding_vectors, np.ndarray sites):
+def build_model_matrix(
+        const double[:, ::1] encoding_vectors,
+        const int[:, ::1] site_table,
+        const int[::1] site_orders,
+        int n_threads=1):
+    """Build model matrix.
 
-    cdef int n = encoding_vectors.shape[0]
-    cdef int m = sites.shape[0]
-    cdef int i, j, k, l, element
-    cdef np.ndarray matrix = np.ones([n, m], dtype=DTYPE)
+    Rows are computed in parallel, without the GIL, over ``n_threads``
+    OpenMP threads.
+
+    Parameters
+    ----------
+    encoding_vectors : 2d array of floats
+        encoded genotypes (see encode_vectors).
+
+    site_table : 2d array of int32
+        padded table of interaction sites (see sites_to_table).
+
+    site_orders : 1d array of int32
+        order of each interaction site.
+
+    n_threads : int
+        number of threads.
+    """
+    cdef Py_ssize_t n = encoding_vectors.shape[0]
+    cdef Py_ssize_t m = site_table.shape[0]
+    cdef Py_ssize_t i, j, k
+    cdef double element
+
+    matrix = np.empty((n, m), dtype=DTYPE)
+    cdef signed char[:, ::1] out = matrix
 
     # Interate over rows
-    for i in range(n):
+    for i in prange(n, nogil=True, num_threads=max(n_threads, 1),
+                    schedule='static'):
 
         # Iterate over cols
         for j in range(m):
-            element = 1
             # Product of sites in encoding vector
-            l = sites[j].shape[0]
-            for k in range(l):
-                element = element * encoding_vectors[i, sites[j][k]]
+            element = 1
+            for k in range(site_orders[j]):
+                element = element * encoding_vectors[i, site_table[j, k]]
 
-            # Multiply these elements
-            matrix[i,j] = element
+            out[i, j] = <signed char> element
 
     return matrix
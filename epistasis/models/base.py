@@ -1,7 +1,10 @@
 import json
 import inspect
+import itertools as it
 import numpy as np
 import pandas as pd
+from scipy.sparse import issparse
+from scipy.sparse.linalg import LinearOperator
 from sklearn.preprocessing import binarize
 
 from abc import abstractmethod, ABC, ABCMeta
@@ -10,10 +13,17 @@ from abc import abstractmethod, ABC, ABCMeta
 from gpmap.gpm import GenotypePhenotypeMap
 
 # Local imports
-from epistasis.mapping import EpistasisMap, mutations_to_sites
-from epistasis.matrix import get_model_matrix
+from epistasis.mapping import EpistasisMap, SiteSpace, supported_sites
+from epistasis.matrix import (get_model_matrix,
+                              get_sparse_model_matrix,
+                              extend_model_matrix,
+                              iter_model_matrix,
+                              encode_genotypes,
+                              MAX_BYTES)
 from epistasis.utils import (extract_mutations_from_genotypes,
                              genotypes_to_X)
+from epistasis.shared import SharedArray, HAS_SHARED_MEMORY
+from epistasis.cache import MatrixCache, MATRIX_REGISTRY
 from .utils import XMatrixException
 from sklearn.base import RegressorMixin, BaseEstimator
 
@@ -46,6 +56,26 @@ class AbstractModel(ABC):
 
     This class sets all docstrings not given in subclasses.
     """
+    # Data type of model matrices built by the model. Elements are -1, 0, or
+    # 1, so int8 is exact; set to "float32" to store matrices ready for BLAS.
+    Xdtype = "int8"
+
+    # On-disk cache of model matrices (see epistasis.cache.ModelMatrixCache).
+    Xcache = None
+
+    # Maximum bytes of matrices kept in Xbuilt (see
+    # epistasis.cache.MatrixCache). None keeps every matrix.
+    Xmax_bytes = None
+
+    # Minimum number of genotypes carrying an interaction for it to be a
+    # column of X (see add_gpm). None keeps all interactions.
+    min_support = None
+
+    # Keep the SVD of the last X fit by linear models, so refits of the same
+    # X reuse it (see epistasis.cache.SVDCache). The float64 factors are
+    # several times the size of X and are not counted in Xmax_bytes.
+    Xsvd_keep = False
+
     def __new__(self, *args, **kwargs):
         """Replace the docstrings of a subclass with docstrings in
         this base class.
@@ -344,7 +374,121 @@ class AbstractModel(ABC):
             return -np.inf
         return lnlike
 
-    def add_X(self, X=None, key=None):
+    def iter_X(self, X=None, max_bytes=MAX_BYTES):
+        """Iterate over blocks of rows of the X matrix for a list of
+        genotypes.
+
+        Parameters
+        ----------
+        X : None or iterable of genotypes. (default=None)
+            genotypes for rows of X. If None, the model uses genotypes in
+            the attached genotype-phenotype map.
+
+        max_bytes : int
+            maximum size of each block of X, in bytes.
+
+        Yields
+        ------
+        rows : slice
+            rows of the full X matrix in this block.
+
+        X : ndarray
+            block of X.
+        """
+        if X is None:
+            X = self.gpm.genotypes
+
+        # Lists and arrays of genotypes are encoded at once; other
+        # iterables are encoded a chunk at a time.
+        if hasattr(X, "__len__"):
+            binary = encode_genotypes(self.gpm.wildtype, X,
+                                      self.gpm.mutations)
+        else:
+            def iter_binary(genotypes):
+                genotypes = iter(genotypes)
+                while True:
+                    chunk = list(it.islice(genotypes, 4096))
+                    if len(chunk) == 0:
+                        break
+                    for b in encode_genotypes(self.gpm.wildtype, chunk,
+                                              self.gpm.mutations):
+                        yield b
+            binary = iter_binary(X)
+
+        return iter_model_matrix(binary, self.Xcolumns,
+                                 model_type=self.model_type,
+                                 max_bytes=max_bytes,
+                                 dtype=self.Xdtype)
+
+    def chunked(self, method, X=None, max_bytes=MAX_BYTES, **kwargs):
+        """Evaluate a model method on blocks of rows of X, keeping the size
+        of the X matrix in memory bounded.
+
+        Methods that return a value per genotype, like "predict",
+        "hypothesis" and "lnlike_of_data", are concatenated block by block.
+        "score" accumulates the coefficient of determination (R^2) of the
+        model's predictions block by block.
+
+        Parameters
+        ----------
+        method : str
+            name of the model method to evaluate.
+
+        X : None or iterable of genotypes. (default=None)
+            genotypes for rows of X. If None, the model uses genotypes in
+            the attached genotype-phenotype map.
+
+        max_bytes : int
+            maximum size of each block of X, in bytes.
+
+        Keyword arguments are passed to the method. Per-genotype arrays
+        (y, yerr and lnprior) are sliced to the rows of each block. If X is
+        given, the arrays the method takes must be given too, with one
+        entry per genotype in X.
+
+        Returns
+        -------
+        out : ndarray or float
+            method output for all genotypes.
+        """
+        # Resolve per-genotype arrays once, before slicing. Arrays the
+        # method takes but that are not given default to the whole map,
+        # whose rows only line up with X when X is the map.
+        func = getattr(self, method)
+        parameters = inspect.signature(func).parameters
+        handlers = {"y": self._y, "yerr": self._yerr,
+                    "lnprior": self._lnprior}
+        arrays = {}
+        for key, handler in handlers.items():
+            if key in kwargs or key in parameters or \
+                    (key == "y" and method == "score"):
+                data = kwargs.pop(key, None)
+                if X is not None and data is None:
+                    raise Exception("{} must be given when X is "
+                                    "given.".format(key))
+                data = np.asarray(handler(data=data, method=method))
+                if X is not None and hasattr(X, "__len__") and \
+                        len(data) != len(X):
+                    raise Exception("{} must have one entry per genotype "
+                                    "in X.".format(key))
+                arrays[key] = data
+
+        if method == "score":
+            y = np.asarray(arrays["y"], dtype=float)
+            ss_res = 0.0
+            for rows, Xblock in self.iter_X(X, max_bytes=max_bytes):
+                ypred = self.predict(X=Xblock)
+                ss_res += np.sum((y[rows] - ypred)**2)
+            ss_tot = np.sum((y - y.mean())**2)
+            return 1 - ss_res / ss_tot
+
+        blocks = []
+        for rows, Xblock in self.iter_X(X, max_bytes=max_bytes):
+            sliced = {key: val[rows] for key, val in arrays.items()}
+            blocks.append(func(X=Xblock, **sliced, **kwargs))
+        return np.concatenate(blocks)
+
+    def add_X(self, X=None, key=None, sparse=False):
         """Add X to Xbuilt
 
         Keyword arguments for X:
@@ -354,7 +498,9 @@ class AbstractModel(ABC):
             are missing they will not be included in fit. At the end of
             fitting, an epistasis map attribute is attached to the model
             class.
-
+        - SharedArray :
+            a model matrix in shared memory (see epistasis.shared). The
+            shared memory is used directly, without a copy.
 
         Parameters
         ----------
@@ -362,13 +508,16 @@ class AbstractModel(ABC):
             see above for details.
         key : str
             name for storing the matrix.
+        sparse : bool (default=False)
+            if True, build X as a scipy.sparse.csr_matrix. Only available
+            for local models.
 
         Returns
         -------
-        Xbuilt : numpy.ndarray
+        Xbuilt : numpy.ndarray or scipy.sparse.csr_matrix
             newly built 2d array matrix
         """
-        if isinstance(X, str) and X == None:
+        if X is None:
 
             if hasattr(self, "gpm") is False:
                 raise XMatrixException("To build None, 'missing', or"
@@ -382,15 +531,26 @@ class AbstractModel(ABC):
             index = self.gpm.binary
 
             # Build numpy array
-            x = get_model_matrix(index, columns, model_type=self.model_type)
-
-            # Set matrix with given key.
+            if sparse:
+                x = get_sparse_model_matrix(index, columns,
+                                            model_type=self.model_type,
+                                            dtype=self.Xdtype)
+            else:
+                x = self._build_X()
+
+            # Set matrix with given key. Dense matrices of the map can be
+            # rebuilt if dropped from Xbuilt.
             if key is None:
                 key = X
 
-            self.Xbuilt[key] = x
+            self.Xbuilt.put(key, x, source=None if sparse else "obs")
+
+        elif (isinstance(X, (np.ndarray, pd.DataFrame)) or
+              issparse(X) or isinstance(X, LinearOperator) or
+              (HAS_SHARED_MEMORY and isinstance(X, SharedArray))):
+            if HAS_SHARED_MEMORY and isinstance(X, SharedArray):
+                X = X.open()
 
-        elif type(X) == np.ndarray or type(X) == pd.DataFrame:
             # Set key
             if key is None:
                 raise Exception("A key must be given to store.")
@@ -400,22 +560,41 @@ class AbstractModel(ABC):
 
         else:
             raise XMatrixException("X must be one of the following: None, "
-                                   "'complete', numpy.ndarray, or "
-                                   "pandas.DataFrame.")
+                                   "'complete', numpy.ndarray, "
+                                   "pandas.DataFrame, scipy.sparse "
+                                   "matrix, LinearOperator, or "
+                                   "SharedArray.")
 
         Xbuilt = self.Xbuilt[key]
         return Xbuilt
 
-    def add_gpm(self, gpm):
+    def add_gpm(self, gpm, min_support=None):
         """Add a GenotypePhenotypeMap object to the epistasis model.
+
+        Parameters
+        ----------
+        gpm : GenotypePhenotypeMap
+            genotype-phenotype map to fit.
+
+        min_support : int (default=None)
+            if given, only interactions carried by at least min_support
+            genotypes in the map become columns of X. Interactions without
+            support are zero (local) or aliased (global) columns that the
+            data cannot identify. If None, the model's min_support
+            attribute is kept.
         """
         self._gpm = gpm
+        if min_support is not None:
+            self.min_support = min_support
 
         # Reset Xbuilt.
-        self.Xbuilt = {}
+        self.Xbuilt.clear()
+
+        # Hash index from genotypes to rows of the observed X.
+        self.genotype_index = pd.Index(gpm.genotypes)
 
         # Construct columns for X matrix
-        self.Xcolumns = mutations_to_sites(self.order, self.gpm.mutations)
+        self.Xcolumns = self._columns(self.order)
 
         # Map those columns to epistastalis dataframe.
         self.epistasis = EpistasisMap(
@@ -424,6 +603,69 @@ class AbstractModel(ABC):
             model_type=self.model_type)
         return self
 
+    def set_order(self, order):
+        """Change the order of the epistasis model, reusing built X matrices.
+
+        Raising the order appends columns for the new interactions to every
+        matrix in Xbuilt, computed from the columns already there. Lowering
+        the order keeps the leading columns. The epistasis map is extended
+        or rebuilt for the new order, and its values are cleared.
+        """
+        # Columns are ordered by interaction order, so the columns of the
+        # lower order are a prefix of the columns of the higher order.
+        columns = self._columns(order)
+        if order > self.order:
+            # Columns for new orders only.
+            new_columns = columns[len(self.Xcolumns):]
+            self._update_matrices(
+                lambda X: extend_model_matrix(X, self.Xcolumns, new_columns))
+
+            self.epistasis.extend(new_columns)
+            self.epistasis.order = order
+            self.epistasis.values = None
+
+        elif order < self.order:
+            n = len(columns)
+            self._update_matrices(lambda X: X[:, :n])
+
+            self.epistasis = EpistasisMap(
+                sites=columns,
+                order=order,
+                model_type=self.model_type)
+
+        self.order = order
+        self.Xcolumns = columns
+
+        # Share the resized X of the map with other models.
+        if "obs" in self.Xbuilt:
+            MATRIX_REGISTRY.put(self.gpm, columns, self.Xbuilt["obs"],
+                                model_type=self.model_type)
+        return self
+
+    def _columns(self, order):
+        """Interaction sites for the columns of X at a given order."""
+        if self.min_support is None:
+            return SiteSpace(order, self.gpm.mutations)
+        return supported_sites(order, self.gpm.mutations, self.gpm.binary,
+                               min_support=self.min_support)
+
+    def _update_matrices(self, func):
+        """Replace the arrays in Xbuilt whose columns match Xcolumns with
+        func(X). Keys sharing a matrix are updated once. Other matrices are
+        dropped; those with a source are rebuilt on next use."""
+        updated = {}
+        for key, X in list(self.Xbuilt.items()):
+            source = self.Xbuilt.source(key)
+            if ((isinstance(X, np.ndarray) or issparse(X)) and
+                    X.shape[1] == len(self.Xcolumns)):
+                if id(X) not in updated:
+                    updated[id(X)] = func(X)
+                self.Xbuilt.put(key, updated[id(X)], source=source)
+            elif source is not None:
+                self.Xbuilt.link(key, source)
+            else:
+                del self.Xbuilt[key]
+
     @property
     def gpm(self):
         """Data stored in a GenotypePhenotypeMap object."""
@@ -435,69 +677,130 @@ class AbstractModel(ABC):
 
     def _X(self, data=None, method=None):
         """Handle the X argument in this model."""
+        # Model matrices are used as given.
+        if isinstance(data, np.ndarray) and data.ndim == 2:
+            return self.Xbuilt.put(method, data)
+
+        # Arrays in shared memory are used without a copy.
+        if HAS_SHARED_MEMORY and isinstance(data, SharedArray):
+            data = data.open()
+
         # Get object type.
         obj = data.__class__
 
         X = data
         # If X is None, see if we saved an array.
         if X is None:
+            X = self.Xbuilt.get("obs")
 
-            # Get X from genotypes
-            X = genotypes_to_X(
-                self.gpm.wildtype,
-                self.gpm.genotypes,
-                order=self.order,
-                mutations=self.gpm.mutations,
-                model_type=self.model_type
-            )
+            if X is None or X.shape[1] != len(self.Xcolumns):
+                X = self._build_X()
+                self.Xbuilt.put("obs", X, source="obs")
 
-        elif obj is str and X in self.gpm.genotypes:
+        elif obj is str and X in self.genotype_index:
 
             # Get X from genotypes
-            X = genotypes_to_X(
-                self.gpm.wildtype,
-                [X],
-                order=self.order,
-                mutations=self.gpm.mutations,
-                model_type=self.model_type
-            )
+            X = self._genotypes_to_X([X])
 
         # If X is a keyword in Xbuilt, use it.
         elif obj is str and X in self.Xbuilt:
             X = self.Xbuilt[X]
 
+        # Matrices of the map dropped from Xbuilt are rebuilt.
+        elif obj is str and self.Xbuilt.source(X) == "obs":
+            X = self._X(data=None, method=X)
+
         # If 2-d array, keep as so.
-        elif obj is np.ndarray and X.ndim == 2:
+        elif isinstance(X, np.ndarray) and X.ndim == 2:
+            pass
+
+        # If sparse matrix or LinearOperator, keep as so.
+        elif issparse(X) or isinstance(X, LinearOperator):
             pass
 
         # If list of genotypes.
-        elif obj in [list, np.ndarray, pd.DataFrame, pd.Series]:
+        elif isinstance(X, (list, np.ndarray, pd.DataFrame, pd.Series)):
 
             # Get X from genotypes
+            X = self._genotypes_to_X(X)
+        else:
+            raise Exception("X is invalid.")
+
+        # Save X; keys sharing a buffer of the map can be rebuilt.
+        return self.Xbuilt.put(method, X)
+
+    def _build_X(self):
+        """Build X for the genotypes of the attached map.
+
+        Matrices are shared through epistasis.cache.MATRIX_REGISTRY: if any
+        model attached to the same map has built X with these columns (or
+        with more columns, of higher order), it is reused without a copy.
+        """
+        X = MATRIX_REGISTRY.get(self.gpm, self.Xcolumns,
+                                model_type=self.model_type,
+                                dtype=self.Xdtype)
+        if X is None:
             X = genotypes_to_X(
                 self.gpm.wildtype,
-                X,
+                self.gpm.genotypes,
                 order=self.order,
                 mutations=self.gpm.mutations,
-                model_type=self.model_type
+                model_type=self.model_type,
+                sites=self.Xcolumns,
+                dtype=self.Xdtype,
+                cache=self.Xcache
             )
-        else:
-            raise Exception("X is invalid.")
-
-        # Save X
-        self.Xbuilt[method] = X
+            MATRIX_REGISTRY.put(self.gpm, self.Xcolumns, X,
+                                model_type=self.model_type)
         return X
 
+    def _genotypes_to_X(self, genotypes):
+        """Build X for a list of genotypes.
+
+        If the X of the attached map is built, rows of genotypes in the map
+        are gathered from it; only other genotypes are built.
+        """
+        genotypes = np.asarray(genotypes).ravel()
+        obs = self.Xbuilt.get("obs")
+        rows = None
+        if (isinstance(obs, np.ndarray) and
+                obs.shape[1] == len(self.Xcolumns) and
+                self.genotype_index.is_unique):
+            rows = self.genotype_index.get_indexer(genotypes)
+            if np.all(rows >= 0):
+                return obs[rows]
+
+        # Build rows that can't be gathered.
+        missing = slice(None) if rows is None else rows < 0
+        X = genotypes_to_X(
+            self.gpm.wildtype,
+            genotypes[missing],
+            order=self.order,
+            mutations=self.gpm.mutations,
+            model_type=self.model_type,
+            sites=self.Xcolumns,
+            dtype=self.Xdtype,
+            cache=self.Xcache
+        )
+        if rows is None or np.all(missing):
+            return X
+
+        out = np.empty((len(genotypes), X.shape[1]), dtype=X.dtype)
+        out[missing] = X
+        out[~missing] = obs[rows[~missing]]
+        return out
+
     def _y(self, data=None, method=None):
         """Handle y arguments in this model."""
-        # Get object type.
-        obj = data.__class__
         y = data
 
-        if y is None:
+        if HAS_SHARED_MEMORY and isinstance(y, SharedArray):
+            return y.open()
+
+        elif y is None:
             return self.gpm.phenotypes
 
-        elif obj in [list, np.ndarray, pd.Series, pd.DataFrame]:
+        elif isinstance(y, (list, np.ndarray, pd.Series, pd.DataFrame)):
             return y
 
         else:
@@ -505,41 +808,44 @@ class AbstractModel(ABC):
 
     def _yerr(self, data=None, method=None):
         """Handle yerr argument in this model."""
-        # Get object type.
-        obj = data.__class__
         yerr = data
-        if yerr is None:
+        if HAS_SHARED_MEMORY and isinstance(yerr, SharedArray):
+            return yerr.open()
+
+        elif yerr is None:
             return self.gpm.std.upper
 
-        elif obj in [list, np.ndarray, pd.Series, pd.DataFrame]:
+        elif isinstance(yerr, (list, np.ndarray, pd.Series, pd.DataFrame)):
             return yerr
         else:
             raise Exception("yerr is invalid.")
 
     def _thetas(self, data=None, method=None):
         """Handle yerr argument in this model."""
-        # Get object type.
-        obj = data.__class__
         thetas = data
-        if thetas is None:
+        if HAS_SHARED_MEMORY and isinstance(thetas, SharedArray):
+            return thetas.open()
+
+        elif thetas is None:
             return self.thetas
 
-        elif obj in [list, np.ndarray, pd.Series, pd.DataFrame]:
+        elif isinstance(thetas, (list, np.ndarray, pd.Series, pd.DataFrame)):
             return thetas
         else:
             raise Exception("thetas is invalid.")
 
     def _lnprior(self, data=None, method=None):
-        # Get object type.
-        obj = data.__class__
         _lnprior = data
-        if _lnprior is None:
+        if HAS_SHARED_MEMORY and isinstance(_lnprior, SharedArray):
+            return _lnprior.open()
+
+        elif _lnprior is None:
             return np.zeros(self.gpm.n)
 
-        elif obj in [list, np.ndarray, pd.Series, pd.DataFrame]:
+        elif isinstance(_lnprior, (list, np.ndarray, pd.Series, pd.DataFrame)):
             return _lnprior
         else:
-            raise Exceptison("_prior is invalid.")
+            raise Exception("lnprior is invalid.")
 
 
 class BaseModel(AbstractModel, RegressorMixin, BaseEstimator):
@@ -4,6 +4,7 @@ import pandas as pd
 from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
 from sklearn.preprocessing import binarize
 
+from epistasis.cache import MatrixCache
 from epistasis.mapping import EpistasisMap
 from epistasis.models.base import BaseModel, use_sklearn
 from epistasis.models.utils import arghandler
@@ -17,7 +18,7 @@ class EpistasisQuadraticDA(BaseModel):
     def __init__(self, order=1, threshold=5, model_type='global', **kwargs):
         self.model_type = model_type
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
         self.threshold=threshold
 
         super(self.__class__, self).__init__(**kwargs)
@@ -4,6 +4,7 @@ import pandas as pd
 from sklearn.gaussian_process import GaussianProcessClassifier
 from sklearn.preprocessing import binarize
 
+from epistasis.cache import MatrixCache
 from epistasis.mapping import EpistasisMap
 from epistasis.models.base import BaseModel, use_sklearn
 from epistasis.models.utils import arghandler
@@ -19,7 +20,7 @@ class EpistasisGaussianProcess(EpistasisClassifierMixin, BaseModel):
     def __init__(self, order=1, threshold=5, model_type='global', **kwargs):
         self.model_type = model_type
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
         self.threshold=threshold
 
         super(self.__class__, self).__init__(**kwargs)
@@ -5,6 +5,7 @@ import pandas as pd
 from sklearn.mixture import GaussianMixture
 from sklearn.preprocessing import binarize
 
+from epistasis.cache import MatrixCache
 from epistasis.mapping import EpistasisMap
 from epistasis.models.base import BaseModel, use_sklearn
 from epistasis.models.utils import (XMatrixException, arghandler)
@@ -39,7 +40,7 @@ class EpistasisGaussianMixture(EpistasisClassifierMixin, BaseModel):
         super(self.__class__, self).__init__(n_components=n_components, **kwargs)
         self.model_type = model_type
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Store model specs.
         self.model_specs = dict(
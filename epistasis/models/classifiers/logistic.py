@@ -7,6 +7,7 @@ from sklearn.svm import SVC
 from sklearn.naive_bayes import BernoulliNB
 from sklearn.preprocessing import binarize
 
+from epistasis.cache import MatrixCache
 from epistasis.mapping import EpistasisMap
 from epistasis.models.base import BaseModel, use_sklearn
 from epistasis.models.utils import (XMatrixException, arghandler)
@@ -47,7 +48,7 @@ class EpistasisLogisticRegression(EpistasisClassifierMixin, BaseModel):
         self.model_type = model_type
         self.fit_intercept = False
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Store model specs.
         self.model_specs = dict(
@@ -105,7 +106,7 @@ class EpistasisLogisticRegression(EpistasisClassifierMixin, BaseModel):
     @arghandler
     def hypothesis(self, X=None, thetas=None):
         # Calculate probability of each class
-        logit_p0 = 1 / (1 + np.exp(np.dot(X, thetas)))
+        logit_p0 = 1 / (1 + np.exp(X.dot(thetas)))
 
         # Returns probability of class 1
         return logit_p0
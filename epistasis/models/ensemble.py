@@ -7,6 +7,7 @@ from sklearn.base import BaseEstimator, RegressorMixin
 
 from epistasis.stats import pearson
 from ..mapping import EpistasisMap, mutations_to_sites
+from ..cache import MatrixCache
 from .base import BaseModel
 from epistasis.matrix import get_model_matrix
 from .utils import arghandler
@@ -80,7 +81,7 @@ class EpistasisEnsembleRegression(BaseModel):
         self.model_type = 'local'
         self.order = order
         self.states = {}
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
         self.parameters = lmfit.Parameters()
 
     def add_gpm(self, gpm):
@@ -166,7 +167,7 @@ class EpistasisEnsembleRegression(BaseModel):
         nstates = len(self.states)
 
         if X is None:
-            X = self.Xbuilt['fit']
+            X = self._X(data='fit', method='fit')
 
         # Calculate a partition function
         Z = []
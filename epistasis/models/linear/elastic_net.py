@@ -1,8 +1,11 @@
 import numpy as np
+from scipy.sparse import issparse
+from scipy.sparse.linalg import LinearOperator
 from sklearn.linear_model import ElasticNet
 
 from ..base import BaseModel, use_sklearn
-from ..utils import arghandler
+from ..utils import arghandler, XMatrixException
+from ...cache import MatrixCache
 
 # Suppress an annoying error from scikit-learn
 import warnings
@@ -51,7 +54,7 @@ class EpistasisElasticNet(BaseModel):
         self.l1_ratio = 1.0
 
         self.set_params(model_type=model_type, order=order)
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Store model specs.
         self.model_specs = dict(
@@ -77,12 +80,18 @@ class EpistasisElasticNet(BaseModel):
 
     @arghandler
     def fit(self, X=None, y=None, **kwargs):
+        # Coordinate descent needs the columns of X.
+        if isinstance(X, LinearOperator):
+            raise XMatrixException("{} can not be fit with a LinearOperator "
+                                   "X.".format(self.__class__.__name__))
+
         # If a threshold exists in the data, pre-classify genotypes
-        X = np.asfortranarray(X)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         self = super(self.__class__, self).fit(X, y)
 
         # Link coefs to epistasis values.
-        self.epistasis.values = np.reshape(self.coef_, (-1,))
+        self.epistasis.values = self.coef_
         return self
 
     def fit_transform(self, X=None, y=None, **kwargs):
@@ -90,7 +99,10 @@ class EpistasisElasticNet(BaseModel):
 
     @arghandler
     def predict(self, X=None):
-        X = np.asfortranarray(X)
+        if isinstance(X, LinearOperator):
+            return X.dot(self.coef_)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         return super(self.__class__, self).predict(X)
 
     @arghandler
@@ -99,7 +111,8 @@ class EpistasisElasticNet(BaseModel):
 
     @arghandler
     def score(self, X=None, y=None):
-        X = np.asfortranarray(X)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         return super(self.__class__, self).score(X, y)
 
     @property
@@ -108,7 +121,7 @@ class EpistasisElasticNet(BaseModel):
 
     @arghandler
     def hypothesis(self, X=None, thetas=None):
-        return np.dot(X, thetas)
+        return X.dot(np.transpose(thetas))
 
     @arghandler
     def hypothesis_transform(self, X=None, y=None, thetas=None):
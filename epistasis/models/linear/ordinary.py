@@ -1,8 +1,15 @@
 import numpy as np
+from scipy.sparse.linalg import LinearOperator, lsqr
 from sklearn.linear_model import LinearRegression
 
+from epistasis.cache import MatrixCache, SVDCache
+from epistasis.matrix import (ModelMatrixOperator,
+                              get_complete_index,
+                              walsh_hadamard_transform,
+                              subset_sum_transform,
+                              mobius_transform)
 from ..base import BaseModel, use_sklearn
-from ..utils import arghandler
+from ..utils import arghandler, XMatrixException
 
 # Suppress an annoying error from scikit-learn
 import warnings
@@ -25,15 +32,26 @@ class EpistasisLinearRegression(BaseModel):
 
     model_type : str (default="global")
         model matrix type. See publication above for more information
+
+    solver : str (default="auto")
+        "lstsq" builds the model matrix and solves it with least squares.
+        "transform" solves a complete genotype-phenotype map at full order
+        with a fast transform, without building the model matrix. "auto"
+        uses "transform" when the attached map allows it and "lstsq"
+        otherwise. Maps solved by transform store the X of the fit as a
+        ModelMatrixOperator, unless the X of the map is already built.
     """
-    def __init__(self, order=1, model_type="global", n_jobs=1, **kwargs):
+    def __init__(self, order=1, model_type="global", n_jobs=1, solver="auto",
+                 **kwargs):
         # Set Linear Regression settings.
         self.fit_intercept = False
         self.normalize = False
         self.copy_X = False
         self.n_jobs = n_jobs
+        self.solver = solver
         self.set_params(model_type=model_type, order=order)
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
+        self.Xsvd = SVDCache(keep=self.Xsvd_keep)
 
         # Store model specs.
         self.model_specs = dict(
@@ -47,22 +65,114 @@ class EpistasisLinearRegression(BaseModel):
         n += self.epistasis.n
         return n
 
-    #@epistasis_fitter
-    @arghandler
     def fit(self, X=None, y=None, **kwargs):
-        self = super(self.__class__, self).fit(X, y)
+        # Complete maps at full order are solved without an X matrix.
+        if X is None and self.solver != "lstsq":
+            index = self._complete_index()
+            if index is not None:
+                y = self._y(data=y, method="fit")
+                # X of the fit is the X of the map; unless it is already
+                # built, it is stored matrix-free.
+                if "obs" in self.Xbuilt:
+                    self.Xbuilt.put("fit", self.Xbuilt["obs"], source="obs")
+                else:
+                    self.Xbuilt["fit"] = ModelMatrixOperator(
+                        self.gpm.binary, self.Xcolumns,
+                        model_type=self.model_type)
+                return self._fit_complete(index, y)
+
+        if self.solver == "transform":
+            raise XMatrixException("The transform solver requires a complete "
+                                   "genotype-phenotype map, fit at full "
+                                   "order with X=None.")
+
+        X = self._X(data=X, method="fit")
+        y = self._y(data=y, method="fit")
+
+        # Matrix-free model matrices are solved iteratively.
+        if isinstance(X, LinearOperator):
+            y = np.asarray(y, dtype=float)
+            if y.ndim == 1:
+                self.coef_ = lsqr(X, y, atol=1e-10, btol=1e-10)[0]
+            else:
+                self.coef_ = np.array([lsqr(X, col, atol=1e-10,
+                                            btol=1e-10)[0] for col in y.T])
+            self.intercept_ = 0.0
+
+        # Dense matrices are solved by SVD, all columns of a 2d y at once.
+        # With Xsvd_keep, refits of the same matrix (e.g. bootstraps) reuse
+        # its decomposition.
+        elif isinstance(X, np.ndarray):
+            coef = self.Xsvd.solve(X, y)
+            self.coef_ = coef.T
+            self.intercept_ = 0.0
+            self.rank_ = self.Xsvd.rank
+            self.singular_ = self.Xsvd.s
+        else:
+            self = super(self.__class__, self).fit(X, y)
+
+        # Link coefs to epistasis values.
+        self.epistasis.values = self.coef_
+        return self
+
+    def _complete_index(self):
+        """Get indices of a complete map for the transform solver."""
+        return get_complete_index(self.gpm.binary, self.Xcolumns)
+
+    def _fit_complete(self, index, y):
+        """Solve for coefficients of a complete map with a fast transform."""
+        rows, columns = index
+
+        # Order phenotypes by genotype index. Columns of a 2d y are
+        # transformed together.
+        y = np.asarray(y, dtype=float)
+        a = np.empty(y.shape, dtype=float)
+        a[rows] = y
+
+        if self.model_type == "global":
+            # The model matrix of a complete map is a Hadamard matrix.
+            coefs = walsh_hadamard_transform(a) / len(a)
+        else:
+            # The model matrix of a complete map is the subset-sum matrix.
+            coefs = mobius_transform(a)
+
+        self.coef_ = coefs[columns].T
+        self.intercept_ = 0.0
 
         # Link coefs to epistasis values.
-        self.epistasis.values = np.reshape(self.coef_, (-1,))
+        self.epistasis.values = self.coef_
         return self
 
     def fit_transform(self, X=None, y=None, **kwargs):
         return self.fit(X=X, y=y, **kwargs)
 
-    @arghandler
     def predict(self, X=None):
+        # Complete maps at full order are predicted without an X matrix.
+        if X is None and self.solver != "lstsq":
+            index = self._complete_index()
+            if index is not None:
+                return self._predict_complete(index, self.coef_)
+
+        X = self._X(data=X, method="predict")
+        if isinstance(X, LinearOperator):
+            return X.dot(self.coef_)
         return super(self.__class__, self).predict(X)
 
+    def _predict_complete(self, index, thetas):
+        """Compute phenotypes of a complete map with a fast transform."""
+        rows, columns = index
+
+        # Order coefficients by site index.
+        thetas = np.transpose(thetas)
+        a = np.empty(thetas.shape, dtype=float)
+        a[columns] = thetas
+
+        if self.model_type == "global":
+            y = walsh_hadamard_transform(a)
+        else:
+            y = subset_sum_transform(a)
+        return y[rows]
+
     def predict_transform(self, X=None, y=None):
         return self.predict(X=X)
 
@@ -76,7 +186,7 @@ class EpistasisLinearRegression(BaseModel):
 
     @arghandler
     def hypothesis(self, X=None, thetas=None):
-        return np.dot(X, thetas)
+        return X.dot(np.transpose(thetas))
 
     def hypothesis_transform(self, X=None, y=None, thetas=None):
         return self.hypothesis(X=X, thetas=thetas)
@@ -1,8 +1,11 @@
 import numpy as np
+from scipy.sparse import issparse
+from scipy.sparse.linalg import LinearOperator, lsqr
 from sklearn.linear_model import Ridge
 
 from ..base import BaseModel, use_sklearn
-from ..utils import arghandler
+from ..utils import arghandler, XMatrixException
+from ...cache import MatrixCache, SVDCache
 
 # Suppress an annoying error from scikit-learn
 import warnings
@@ -69,7 +72,8 @@ class EpistasisRidge(BaseModel):
         self.l2_ratio = 1.0
 
         self.set_params(model_type=model_type, order=order)
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
+        self.Xsvd = SVDCache(keep=self.Xsvd_keep)
 
         # Store model specs.
         self.model_specs = dict(
@@ -95,12 +99,34 @@ class EpistasisRidge(BaseModel):
 
     @arghandler
     def fit(self, X=None, y=None, **kwargs):
+        # Matrix-free model matrices are solved iteratively; lsqr's damping
+        # term is the square root of the L2 penalty.
+        if isinstance(X, LinearOperator):
+            y = np.asarray(y, dtype=float)
+            coef = [lsqr(X, col, damp=np.sqrt(self.alpha), atol=self.tol,
+                         btol=self.tol, iter_lim=self.max_iter)[0]
+                    for col in np.atleast_2d(y.T)]
+            self.coef_ = coef[0] if y.ndim == 1 else np.array(coef)
+            self.intercept_ = 0.0
+            self.epistasis.values = self.coef_
+            return self
+
+        # Dense matrices are solved by SVD, all columns of a 2d y at once.
+        # With Xsvd_keep, refits of the same matrix (e.g. bootstraps) reuse
+        # its decomposition.
+        if isinstance(X, np.ndarray) and self.solver in ("auto", "svd"):
+            self.coef_ = self.Xsvd.solve(X, y, alpha=self.alpha).T
+            self.intercept_ = 0.0
+            self.epistasis.values = self.coef_
+            return self
+
         # If a threshold exists in the data, pre-classify genotypes
-        X = np.asfortranarray(X)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         self = super(self.__class__, self).fit(X, y)
 
         # Link coefs to epistasis values.
-        self.epistasis.values = np.reshape(self.coef_, (-1,))
+        self.epistasis.values = self.coef_
         return self
 
     def fit_transform(self, X=None, y=None, **kwargs):
@@ -108,7 +134,10 @@ class EpistasisRidge(BaseModel):
 
     @arghandler
     def predict(self, X=None):
-        X = np.asfortranarray(X)
+        if isinstance(X, LinearOperator):
+            return X.dot(self.coef_)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         return super(self.__class__, self).predict(X)
 
     @arghandler
@@ -117,7 +146,8 @@ class EpistasisRidge(BaseModel):
 
     @arghandler
     def score(self, X=None, y=None):
-        X = np.asfortranarray(X)
+        if not issparse(X):
+            X = np.asfortranarray(X)
         return super(self.__class__, self).score(X, y)
 
     @property
@@ -126,7 +156,7 @@ class EpistasisRidge(BaseModel):
 
     @arghandler
     def hypothesis(self, X=None, thetas=None):
-        return np.dot(X, thetas)
+        return X.dot(np.transpose(thetas))
 
     @arghandler
     def hypothesis_transform(self, X=None, y=None, thetas=None):
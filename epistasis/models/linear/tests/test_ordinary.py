@@ -7,6 +7,10 @@ from gpmap import GenotypePhenotypeMap
 
 # Module to test
 from ..ordinary import EpistasisLinearRegression
+from ....cache import ModelMatrixCache
+from ....matrix import ModelMatrixOperator
+from ....shared import share_arrays, HAS_SHARED_MEMORY
+from ...utils import XMatrixException
 
 
 @pytest.fixture
@@ -88,3 +92,316 @@ class TestEpistasisLinearRegression(object):
         # Calculate lnlikelihood
         lnlike = model.lnlikelihood()
         assert lnlike.dtype == float
+
+    @pytest.mark.parametrize("model_type", ["global", "local"])
+    def test_fit_transform_solver(self, gpm, model_type):
+        # A complete map at full order is solved without an X matrix.
+        model = EpistasisLinearRegression(order=self.order,
+                                          model_type=model_type)
+        model.add_gpm(gpm)
+        model.fit()
+        assert "obs" not in model.Xbuilt
+        assert isinstance(model.Xbuilt["fit"], ModelMatrixOperator)
+        np.testing.assert_almost_equal(model.predict(X="fit"), gpm.phenotypes)
+
+        # A built X of the map is reused.
+        model.add_X(key="obs")
+        model.fit()
+        assert model.Xbuilt["fit"] is model.Xbuilt["obs"]
+
+        # Compare to least-squares solution.
+        lstsq = EpistasisLinearRegression(order=self.order,
+                                          model_type=model_type,
+                                          solver="lstsq")
+        lstsq.add_gpm(gpm)
+        lstsq.fit()
+        np.testing.assert_almost_equal(model.coef_, lstsq.coef_)
+        np.testing.assert_almost_equal(model.predict(), gpm.phenotypes)
+
+    def test_fit_transform_solver_incomplete(self, gpm):
+        model = EpistasisLinearRegression(order=2, model_type="global",
+                                          solver="transform")
+        model.add_gpm(gpm)
+        with pytest.raises(XMatrixException):
+            model.fit()
+
+    def test_fit_sparse(self, gpm):
+        model = EpistasisLinearRegression(order=2, model_type="local")
+        model.add_gpm(gpm)
+        X = model.add_X(key="sparse", sparse=True)
+        assert X.format == "csr"
+
+        model.fit(X="sparse")
+        dense = EpistasisLinearRegression(order=2, model_type="local")
+        dense.add_gpm(gpm)
+        dense.fit()
+        np.testing.assert_almost_equal(model.coef_, dense.coef_, decimal=5)
+        np.testing.assert_almost_equal(model.hypothesis(X="sparse"),
+                                       dense.hypothesis(), decimal=5)
+
+    def test_fit_operator(self, gpm):
+        model = EpistasisLinearRegression(order=2, model_type="global")
+        model.add_gpm(gpm)
+        X = ModelMatrixOperator(gpm.binary, model.Xcolumns,
+                                model_type="global")
+        model.fit(X=X)
+
+        dense = EpistasisLinearRegression(order=2, model_type="global")
+        dense.add_gpm(gpm)
+        dense.fit()
+        np.testing.assert_almost_equal(model.coef_, dense.coef_)
+        np.testing.assert_almost_equal(model.predict(X=X), dense.predict())
+        np.testing.assert_almost_equal(model.hypothesis(X=X),
+                                       dense.hypothesis())
+
+    def test_set_order(self, gpm):
+        model = EpistasisLinearRegression(order=1, model_type="global")
+        model.add_gpm(gpm)
+        model.fit()
+
+        # Raise order; X is extended rather than rebuilt.
+        model.set_order(2)
+        assert model.Xbuilt["obs"].shape == (gpm.n, 7)
+        model.fit()
+
+        fresh = EpistasisLinearRegression(order=2, model_type="global")
+        fresh.add_gpm(gpm)
+        fresh.fit()
+        np.testing.assert_array_equal(model.Xbuilt["obs"],
+                                      fresh.Xbuilt["obs"])
+        np.testing.assert_almost_equal(model.coef_, fresh.coef_)
+
+        # Lower order.
+        model.set_order(1)
+        assert model.Xbuilt["obs"].shape == (gpm.n, 4)
+        assert model.epistasis.n == 4
+
+        # Raise order by more than one.
+        model.set_order(3)
+        fresh = EpistasisLinearRegression(order=3, model_type="global")
+        fresh.add_gpm(gpm)
+        np.testing.assert_array_equal(model.Xbuilt["obs"], fresh._X())
+        assert model.epistasis.n == 8
+        assert model.epistasis.sites == fresh.Xcolumns
+
+    def test_chunked(self, gpm):
+        model = EpistasisLinearRegression(order=2, model_type="global")
+        model.add_gpm(gpm)
+        model.fit()
+
+        # Blocks of 3 genotypes.
+        max_bytes = 3 * len(model.Xcolumns)
+        np.testing.assert_almost_equal(
+            model.chunked("predict", max_bytes=max_bytes), model.predict())
+        np.testing.assert_almost_equal(
+            model.chunked("hypothesis", X=gpm.genotypes[:5],
+                          max_bytes=max_bytes),
+            model.hypothesis(X=gpm.genotypes[:5]))
+        np.testing.assert_almost_equal(
+            model.chunked("lnlike_of_data", max_bytes=max_bytes),
+            model.lnlike_of_data())
+        np.testing.assert_almost_equal(
+            model.chunked("score", max_bytes=max_bytes), model.score())
+
+        # Per-genotype arrays must match a genotype list other than the map.
+        genotypes = list(gpm.genotypes[::-1][:5])
+        y = np.asarray(gpm.phenotypes[::-1][:5])
+        yerr = np.asarray(gpm.stdeviations[::-1][:5])
+        np.testing.assert_almost_equal(
+            model.chunked("lnlike_of_data", X=genotypes, y=y, yerr=yerr,
+                          max_bytes=max_bytes),
+            model.lnlike_of_data(X=genotypes, y=y, yerr=yerr))
+        np.testing.assert_almost_equal(
+            model.chunked("score", X=genotypes, y=y, max_bytes=max_bytes),
+            model.score(X=genotypes, y=y))
+        with pytest.raises(Exception):
+            model.chunked("lnlike_of_data", X=genotypes, max_bytes=max_bytes)
+        with pytest.raises(Exception):
+            model.chunked("score", X=genotypes, y=gpm.phenotypes,
+                          max_bytes=max_bytes)
+
+    def test_xbuilt(self, gpm):
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm)
+        model.fit()
+        model.predict()
+
+        # Matrices built from the map share one buffer.
+        obs = model.Xbuilt["obs"]
+        assert model.Xbuilt["fit"] is obs
+        assert model.Xbuilt["predict"] is obs
+        assert model.Xbuilt.nbytes == obs.nbytes
+
+        # Bounded caches drop the least recently used matrices of the map.
+        model.Xbuilt.max_bytes = obs.nbytes
+        model.hypothesis(X=gpm.genotypes[:3])
+        assert "hypothesis" in model.Xbuilt
+        assert "fit" not in model.Xbuilt
+        assert model.Xbuilt.nbytes <= obs.nbytes
+
+        # Dropped matrices of the map are rebuilt.
+        ypred = model.predict(X="fit")
+        np.testing.assert_almost_equal(ypred, model.hypothesis())
+
+    def test_xcache(self, gpm, tmp_path):
+        # float32 matrices are not shared with other tests' models.
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.Xcache = ModelMatrixCache(str(tmp_path))
+        model.Xdtype = "float32"
+        model.add_gpm(gpm)
+        model.fit()
+        assert isinstance(model.Xbuilt["obs"], np.memmap)
+        score = model.score()
+        lnlike = model.lnlikelihood()
+
+        # A fresh model reads the matrix back from disk.
+        del model
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.Xcache = ModelMatrixCache(str(tmp_path))
+        model.Xdtype = "float32"
+        model.add_gpm(gpm)
+        model.fit()
+        assert isinstance(model.Xbuilt["obs"], np.memmap)
+        np.testing.assert_almost_equal(model.score(), score)
+        np.testing.assert_almost_equal(model.lnlikelihood(), lnlike)
+
+    def test_shared_columns(self, gpm):
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm)
+        model.fit()
+
+        # Models on the same map reuse the leading columns of X.
+        additive = EpistasisLinearRegression(order=1, model_type="local",
+                                             solver="lstsq")
+        additive.add_gpm(gpm)
+        additive.fit()
+        X = additive.Xbuilt["obs"]
+        assert np.shares_memory(X, model.Xbuilt["obs"])
+        np.testing.assert_array_equal(X, model.Xbuilt["obs"][:, :4])
+
+    def test_refit(self, gpm):
+        model = EpistasisLinearRegression(order=2, model_type="global",
+                                          solver="lstsq")
+        model.add_gpm(gpm)
+        X = model.add_X()
+
+        # Decompositions are not kept by default.
+        model.fit(X=X)
+        assert model.Xsvd.U is None and model.Xsvd.nbytes == X.shape[1] * 8
+
+        # Refits of the same matrix reuse its decomposition.
+        model.Xsvd.keep = True
+        model.fit(X=X)
+        U = model.Xsvd.U
+        y = np.random.randn(gpm.n)
+        model.fit(X=X, y=y)
+        assert model.Xsvd.U is U
+        np.testing.assert_almost_equal(
+            model.coef_, np.linalg.lstsq(X, y, rcond=None)[0])
+
+    @pytest.mark.parametrize("solver", ["lstsq", "transform"])
+    def test_fit_traits(self, gpm, solver):
+        # Three traits measured on the same genotypes.
+        Y = np.column_stack([gpm.phenotypes, np.random.randn(gpm.n, 2)])
+        model = EpistasisLinearRegression(order=self.order, model_type="global",
+                                          solver=solver)
+        model.add_gpm(gpm)
+        model.fit(y=Y)
+        assert model.epistasis.values.shape == (3, 8)
+        assert model.epistasis.table.shape == (3, 8)
+        assert model.predict().shape == (gpm.n, 3)
+        np.testing.assert_almost_equal(model.predict(), Y)
+
+        # Same as fitting each trait alone.
+        for i in range(3):
+            single = EpistasisLinearRegression(order=self.order,
+                                               model_type="global",
+                                               solver=solver)
+            single.add_gpm(gpm)
+            single.fit(y=Y[:, i])
+            np.testing.assert_almost_equal(model.epistasis.values[i],
+                                           single.epistasis.values)
+
+    @pytest.mark.skipif(not HAS_SHARED_MEMORY,
+                        reason="requires Python 3.8 or later")
+    def test_fit_shared(self, gpm):
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm)
+        model.fit()
+
+        handles = share_arrays(X=model.add_X(), y=gpm.phenotypes)
+        try:
+            shared = EpistasisLinearRegression(order=self.order,
+                                               model_type="local",
+                                               solver="lstsq")
+            shared.add_gpm(gpm)
+            shared.fit(X=handles["X"], y=handles["y"])
+            np.testing.assert_almost_equal(shared.coef_, model.coef_)
+
+            # Stored without a copy.
+            X = shared.add_X(X=handles["X"], key="shared")
+            assert np.shares_memory(X, handles["X"].open())
+        finally:
+            for handle in handles.values():
+                handle.unlink()
+
+    def test_min_support(self, gpm):
+        # Only genotype 111 carries the third-order interaction.
+        model = EpistasisLinearRegression(order=3, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm, min_support=2)
+        assert len(model.Xcolumns) == 7
+        assert [1, 2, 3] not in model.Xcolumns.tolist()
+        assert model.epistasis.n == 7
+
+        model.fit()
+        assert model.Xbuilt["fit"].shape == (gpm.n, 7)
+        assert len(model.coef_) == 7
+
+        # Pruned columns follow changes of order.
+        model.set_order(1)
+        assert model.Xbuilt["obs"].shape == (gpm.n, 4)
+        model.set_order(3)
+        assert model.Xbuilt["obs"].shape == (gpm.n, 7)
+
+        # min_support is kept when the map is attached again.
+        model.add_gpm(gpm)
+        assert model.min_support == 2
+        assert len(model.Xcolumns) == 7
+
+        # Supported third-order columns are added across the jump.
+        model = EpistasisLinearRegression(order=1, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm, min_support=1)
+        model.fit()
+        model.set_order(3)
+        assert model.Xbuilt["obs"].shape == (gpm.n, 8)
+        assert [1, 2, 3] in model.Xcolumns.tolist()
+
+    def test_genotype_rows(self, gpm):
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(gpm)
+        model.fit()
+        obs = model.Xbuilt["obs"]
+
+        # Genotypes in the map are rows of the observed X.
+        genotypes = ["111", "000", "011"]
+        rows = [list(gpm.genotypes).index(g) for g in genotypes]
+        model.hypothesis(X=genotypes)
+        np.testing.assert_array_equal(model.Xbuilt["hypothesis"], obs[rows])
+
+        # Genotypes missing from the map are built.
+        subset = GenotypePhenotypeMap(gpm.wildtype, gpm.genotypes[:6],
+                                      gpm.phenotypes[:6])
+        model = EpistasisLinearRegression(order=self.order, model_type="local",
+                                          solver="lstsq")
+        model.add_gpm(subset)
+        model.fit()
+        model.hypothesis(X=genotypes)
+        np.testing.assert_array_equal(model.Xbuilt["hypothesis"], obs[rows])
@@ -13,6 +13,7 @@ from sklearn.base import BaseEstimator, RegressorMixin
 from gpmap import GenotypePhenotypeMap
 
 # Epistasis imports.
+from epistasis.cache import MatrixCache
 from epistasis.mapping import EpistasisMap
 from epistasis.models.base import BaseModel
 from epistasis.models.utils import (arghandler, FittingError)
@@ -70,7 +71,7 @@ class EpistasisNonlinearRegression(BaseModel):
         self.minimizer = FunctionMinimizer(self.function, **p0)
         self.parameters = self.minimizer.parameters
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Construct parameters object
         self.set_params(model_type=model_type)
@@ -105,7 +106,7 @@ class EpistasisNonlinearRegression(BaseModel):
     @arghandler
     def transform(self, X=None, y=None):
         # Use a first order matrix only.
-        if type(X) == np.ndarray or type(X) == pd.DataFrame:
+        if isinstance(X, (np.ndarray, pd.DataFrame)):
             Xadd = X[:, :self.Additive.epistasis.n]
         else:
             Xadd = X
@@ -136,7 +137,7 @@ class EpistasisNonlinearRegression(BaseModel):
         )
 
         # Use a first order matrix only.
-        if type(X) == np.ndarray or type(X) == pd.DataFrame:
+        if isinstance(X, (np.ndarray, pd.DataFrame)):
             Xadd = X[:, :self.Additive.epistasis.n]
         else:
             Xadd = X
@@ -151,7 +152,7 @@ class EpistasisNonlinearRegression(BaseModel):
         """Estimate the scale of multiple mutations in a genotype-phenotype
         map."""
         # Use a first order matrix only.
-        if type(X) == np.ndarray or type(X) == pd.DataFrame:
+        if isinstance(X, (np.ndarray, pd.DataFrame)):
             Xadd = X[:, :self.Additive.epistasis.n]
         else:
             Xadd = X
@@ -201,7 +202,7 @@ class EpistasisNonlinearRegression(BaseModel):
         epistasis = thetas[i:i + j]
 
         # Part 1: Linear portion
-        x = np.dot(X, epistasis)
+        x = X.dot(epistasis)
 
         # Part 2: Nonlinear portion
         ynonlin = self.minimizer.function(x, *parameters)
@@ -8,6 +8,7 @@ import pandas as pd
 import lmfit
 from lmfit import Parameter, Parameters
 
+from epistasis.cache import MatrixCache
 from epistasis.stats import gmean, pearson
 from epistasis.models.utils import arghandler
 from epistasis.models.linear.ordinary import EpistasisLinearRegression
@@ -166,7 +167,7 @@ class EpistasisPowerTransform(EpistasisNonlinearRegression):
         self.minimizer = PowerTransformMinizer(**p0)
         self.parameters = self.minimizer.parameters
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Construct parameters object
         self.set_params(model_type=model_type)
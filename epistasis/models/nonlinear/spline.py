@@ -4,6 +4,7 @@ from .minimizer import Minimizer
 from .ordinary import EpistasisNonlinearRegression
 from epistasis.models import EpistasisLinearRegression
 from epistasis.models.utils import (arghandler, FittingError)
+from epistasis.cache import MatrixCache
 from scipy.interpolate import UnivariateSpline
 from lmfit import Parameter, Parameters
 
@@ -113,7 +114,7 @@ class EpistasisSpline(EpistasisNonlinearRegression):
         # Set up the function for fitting.
         self.minimizer = SplineMinizer(k=self.k, s=self.s)
         self.order = 1
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
 
         # Construct parameters object
         self.set_params(model_type=model_type)
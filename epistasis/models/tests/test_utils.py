@@ -36,3 +36,46 @@
 #     assert "complete" in model.Xbuilt
 #     assert "predict" in model.Xbuilt
 #     assert model.Xbuilt["predict"].shape == (4,4)
+
+import numpy as np
+
+from ..utils import arghandler
+
+
+class Handled(object):
+    """Object with argument handlers that count their calls."""
+    def __init__(self):
+        self.calls = []
+
+    def _X(self, data=None, method=None):
+        self.calls.append(("X", method))
+        return np.ones((2, 2)) if data is None else data
+
+    def _y(self, data=None, method=None):
+        self.calls.append(("y", method))
+        return np.zeros(2) if data is None else np.asarray(data)
+
+    @arghandler
+    def fit(self, X=None, y=None):
+        return X, y
+
+
+def test_arghandler():
+    obj = Handled()
+    X, y = obj.fit()
+    np.testing.assert_array_equal(X, np.ones((2, 2)))
+    np.testing.assert_array_equal(y, np.zeros(2))
+    assert obj.calls == [("X", "fit"), ("y", "fit")]
+
+    # Arrays skip their handlers, except X.
+    obj.calls = []
+    y = np.arange(2.0)
+    assert obj.fit(y=y)[1] is y
+    assert obj.calls == [("X", "fit")]
+
+    # Positional arguments.
+    obj.calls = []
+    X, y = obj.fit(np.eye(2), [1, 2])
+    np.testing.assert_array_equal(X, np.eye(2))
+    np.testing.assert_array_equal(y, [1, 2])
+    assert obj.calls == [("X", "fit"), ("y", "fit")]
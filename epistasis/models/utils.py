@@ -19,35 +19,42 @@ def arghandler(method):
     corresponding method attached to the object named "_{argument}". These
     methods given default values to arguments.
 
+    The signature of the method is read once, when the method is decorated.
+    Arguments given as numpy arrays (other than X) skip their handlers,
+    since the handlers return arrays unchanged; X always goes through its
+    handler, which stores it in Xbuilt. Nested calls between decorated
+    methods, which pass arrays that are already resolved, take this path.
+
     Ignores self and kwargs
     """
-    @wraps(method)
-    def inner(self, *args, **kwargs):
-        # Get method name
-        name = method.__name__
+    name = method.__name__
 
-        # Inspect function for arguments to update.
-        out = inspect.signature(method)
+    # Arguments of the method and their defaults, without self and kwargs.
+    parameters = list(inspect.signature(method).parameters.values())[1:]
+    parameters = [p for p in parameters
+                  if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+    argnames = tuple(p.name for p in parameters)
+    defaults = {p.name: p.default for p in parameters}
 
-        # Construct kwargs from signature.
-        kws = {key: val.default for key, val in out.parameters.items()}
-        kws.pop('self')
+    # Names of handler methods.
+    handlers = {arg: "_{}".format(arg) for arg in argnames}
 
-        # Try to remove kwargs.
-        try:
-            kws.pop('kwargs')
-        except:
-            pass
+    @wraps(method)
+    def inner(self, *args, **kwargs):
+        # Construct kwargs from signature.
+        kws = dict(defaults)
+        if args:
+            kws.update(zip(argnames, args))
 
         # Update kwargs with user specified kwargs.
-        kws.update(**kwargs)
+        kws.update(kwargs)
 
         # Handle each argument
-        for arg in kws:
-            # Get handler function.
-            handler_name = "_{}".format(arg)
-            handler = getattr(self, handler_name)
-            kws[arg] = handler(data=kws[arg], method=name)
+        for arg, data in kws.items():
+            if isinstance(data, np.ndarray) and arg != "X":
+                continue
+            handler_name = handlers.get(arg) or "_{}".format(arg)
+            kws[arg] = getattr(self, handler_name)(data=data, method=name)
 
         return method(self, **kws)
     return inner
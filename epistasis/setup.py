@@ -1,9 +1,48 @@
+import os
+import shutil
+import tempfile
 from distutils.core import setup
+from distutils.extension import Extension
 from Cython.Build import cythonize
 import numpy
 
+
+def has_openmp():
+    """Check whether the C compiler can build and link OpenMP code."""
+    from distutils.ccompiler import new_compiler
+    from distutils.errors import CompileError, LinkError
+    from distutils.sysconfig import customize_compiler
+
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmpdir, "openmp_check.c")
+        with open(src, "w") as f:
+            f.write("#include <omp.h>\n"
+                    "int main(void) { return omp_get_max_threads() < 1; }\n")
+        objects = compiler.compile([src], output_dir=tmpdir,
+                                   extra_postargs=["-fopenmp"])
+        compiler.link_executable(objects,
+                                 os.path.join(tmpdir, "openmp_check"),
+                                 extra_postargs=["-fopenmp"])
+    except (CompileError, LinkError):
+        return False
+    finally:
+        shutil.rmtree(tmpdir)
+    return True
+
+
 # To build extension, run python setup.py build_ext --inplace
+# Without OpenMP support (e.g. Apple clang), the prange loops run serially.
+openmp_args = ["-fopenmp"] if has_openmp() else []
+extension = Extension("matrix_cython",
+                      ["matrix_cython.pyx"],
+                      include_dirs=[numpy.get_include()],
+                      extra_compile_args=openmp_args,
+                      extra_link_args=openmp_args)
+
 setup(
-    ext_modules=cythonize("matrix_cython.pyx"),
+    ext_modules=cythonize(extension),
     include_dirs=[numpy.get_include()]
 )
@@ -0,0 +1,142 @@
+__doc__ = """Submodule for sharing model matrices and phenotypes between
+processes.
+
+Arrays are copied once into shared memory and passed to workers as small,
+picklable handles. Workers map the same memory, so the memory used by a pool
+of workers does not grow with the number of workers.
+
+Example
+-------
+
+    >>> X = model.add_X()
+    >>> handles = share_arrays(X=X, y=gpm.phenotypes)
+    >>> pool.map(partial(fit, **handles), folds)
+
+    # in the worker
+    >>> model.fit(X=handles["X"], y=handles["y"])
+
+    # when all workers are done
+    >>> for handle in handles.values(): handle.unlink()
+"""
+# -------------------------------------------------------
+# Outside imports
+# -------------------------------------------------------
+
+import numpy as np
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    # multiprocessing.shared_memory was added in Python 3.8.
+    SharedMemory = None
+    HAS_SHARED_MEMORY = False
+
+
+def _require_shared_memory():
+    if not HAS_SHARED_MEMORY:
+        raise Exception("Sharing arrays between processes requires "
+                        "Python 3.8 or later.")
+
+
+class SharedArray(object):
+    """Picklable handle to a numpy array stored in shared memory.
+
+    Pickling a handle sends only the name, shape and dtype of the array.
+    Call ``open`` to get the array as a view of the shared memory.
+
+    Parameters
+    ----------
+    name : str
+        name of the shared memory block.
+
+    shape : tuple
+        shape of the array.
+
+    dtype : numpy dtype
+        data type of the array.
+    """
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._shm = None
+
+    def __getstate__(self):
+        return dict(name=self.name, shape=self.shape, dtype=self.dtype.str)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __repr__(self):
+        return "SharedArray(name={!r}, shape={}, dtype={})".format(
+            self.name, self.shape, self.dtype)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def _attach(self):
+        """Attach to the shared memory block."""
+        _require_shared_memory()
+        try:
+            # Memory opened by a worker is owned by the process that shared
+            # it; don't let the worker's resource tracker remove it.
+            return SharedMemory(name=self.name, track=False)
+        except TypeError:
+            return SharedMemory(name=self.name)
+
+    def open(self):
+        """Get the array as a view of the shared memory (no copy)."""
+        if self._shm is None:
+            self._shm = self._attach()
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self):
+        """Detach this process from the shared memory. Arrays returned by
+        ``open`` must not be used after closing."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Free the shared memory. Call once, from the process that shared
+        the array, after all workers are done."""
+        if self._shm is None:
+            self._shm = self._attach()
+        self._shm.unlink()
+        self.close()
+
+
+def share_array(a):
+    """Copy an array into shared memory.
+
+    Parameters
+    ----------
+    a : array-like
+        array to share.
+
+    Returns
+    -------
+    handle : SharedArray
+        picklable handle to the shared array. The caller owns the memory and
+        must call ``handle.unlink()`` when done.
+    """
+    _require_shared_memory()
+    a = np.ascontiguousarray(a)
+    shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+    handle = SharedArray(shm.name, a.shape, a.dtype)
+    handle._shm = shm
+    handle.open()[...] = a
+    return handle
+
+
+def share_arrays(**arrays):
+    """Copy a set of arrays into shared memory.
+
+    Returns
+    -------
+    handles : dict
+        SharedArray handles under the same keywords as the arrays.
+    """
+    return {key: share_array(a) for key, a in arrays.items()}
@@ -3,6 +3,7 @@ from gpmap.gpm import GenotypePhenotypeMap
 from gpmap import utils
 
 # Local imports
+from epistasis.cache import MatrixCache
 from epistasis.mapping import (EpistasisMap, mutations_to_sites, assert_epistasis)
 from epistasis.matrix import get_model_matrix
 from epistasis.utils import extract_mutations_from_genotypes
@@ -20,12 +21,18 @@ class BaseSimulation(GenotypePhenotypeMap):
     mutations : dict
         dictionary mapping each site the possible mutations
     """
+    # Data type of model matrices built by the simulation.
+    Xdtype = "int8"
+
+    # Maximum bytes of matrices kept in Xbuilt. None keeps every matrix.
+    Xmax_bytes = None
+
     def __init__(self, wildtype, mutations,
                  model_type="global",
                  **kwargs
                  ):
         self.model_type = model_type
-        self.Xbuilt = {}
+        self.Xbuilt = MatrixCache(max_bytes=self.Xmax_bytes)
         genotypes = np.array(
             utils.mutations_to_genotypes(mutations, wildtype=wildtype))
         phenotypes = np.ones(len(genotypes))
@@ -75,7 +82,8 @@ class BaseSimulation(GenotypePhenotypeMap):
             index = self.binary
 
             # Build numpy array
-            x = get_model_matrix(index, columns, model_type=self.model_type)
+            x = get_model_matrix(index, columns, model_type=self.model_type,
+                                 dtype=self.Xdtype)
 
             # Set matrix with given key.
             if key is None:
@@ -83,7 +91,7 @@ class BaseSimulation(GenotypePhenotypeMap):
 
             self.Xbuilt[key] = x
 
-        elif type(X) == np.ndarray or type(X) == pd.DataFrame:
+        elif isinstance(X, (np.ndarray, pd.DataFrame)):
             # Set key
             if key is None:
                 raise Exception("A key must be given to store.")
@@ -105,8 +113,8 @@ class BaseSimulation(GenotypePhenotypeMap):
         # Attach an epistasis model.
         self.order = order
         self.add_epistasis()
-        self.epistasis.data.values = np.zeros(self.epistasis.n)
-        self.epistasis.data.values[0] = 1
+        self.epistasis.values = np.zeros(self.epistasis.n)
+        self.epistasis.values[0] = 1
         return self
 
     def set_coefs_sites(self, sites):
@@ -127,21 +135,21 @@ class BaseSimulation(GenotypePhenotypeMap):
             list of floats representing to epistatic coefficients.
         """
         self.set_coefs_sites(sites)
-        self.epistasis.data.values = values
+        self.epistasis.values = values
         self.build()
         return self
 
     @assert_epistasis
     def set_wildtype_phenotype(self, value):
         """Set the wildtype phenotype."""
-        self.epistasis.data.values[0] = value
+        self.epistasis.values[0] = value
         self.build()
 
     @assert_epistasis
     def set_coefs_values(self, values):
         """Set coefficient values.
         """
-        self.epistasis.data.values = values
+        self.epistasis.values = values
         self.build()
         return self
 
@@ -156,7 +164,7 @@ class BaseSimulation(GenotypePhenotypeMap):
             low and high bounds for coeff values.
         """
         # Add values to epistatic interactions
-        self.epistasis.data.values = np.random.uniform(
+        self.epistasis.values = np.random.uniform(
             coef_range[0], coef_range[1], size=len(self.epistasis.sites))
         self.build()
         return self
@@ -178,7 +186,7 @@ class BaseSimulation(GenotypePhenotypeMap):
                                                     size=len(index))
 
             # Map to epistasis object.
-            self.epistasis.data.values[index[0]: index[-1] + 1] = vals
+            self.epistasis.values[index[0]: index[-1] + 1] = vals
         self.build()
         return self
 
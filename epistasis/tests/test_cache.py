@@ -0,0 +1,200 @@
+# External imports
+import itertools as it
+import pytest
+
+import numpy as np
+
+# Module to test
+from ..cache import (hash_model_matrix, MatrixCache, MatrixRegistry,
+                     SVDCache, ModelMatrixCache)
+from ..matrix import get_model_matrix
+
+
+@pytest.fixture
+def binary():
+    """Binary genotypes of a complete, 4-site map."""
+    return ["".join(g) for g in it.product("01", repeat=4)]
+
+
+@pytest.fixture
+def sites():
+    """All interaction sites up to second order for a 4-site map."""
+    sites = [[0]]
+    for order in range(1, 3):
+        sites += [list(c) for c in it.combinations(range(1, 5), order)]
+    return sites
+
+
+def test_hash_model_matrix(binary, sites):
+    key = hash_model_matrix(binary, sites)
+    assert key == hash_model_matrix(list(binary), [list(s) for s in sites])
+    assert key != hash_model_matrix(binary, sites, model_type="local")
+    assert key != hash_model_matrix(binary, sites, dtype=np.float32)
+    assert key != hash_model_matrix(binary, sites[:-1])
+    assert key != hash_model_matrix(binary[::-1], sites)
+
+
+def test_cache_get_put(tmp_path, binary, sites):
+    cache = ModelMatrixCache(str(tmp_path))
+    key = cache.key(binary, sites)
+    assert key not in cache
+    assert cache.get(key) is None
+
+    X = get_model_matrix(binary, sites)
+    Xc = cache.put(key, X)
+    assert key in cache
+    assert isinstance(Xc, np.memmap)
+    assert not Xc.flags.writeable
+    np.testing.assert_array_equal(Xc, X)
+    np.testing.assert_array_equal(cache.get(key), X)
+
+    cache.clear()
+    assert key not in cache
+    assert cache.nbytes == 0
+
+
+def test_cache_evict(tmp_path, binary, sites):
+    X = get_model_matrix(binary, sites)
+    cache = ModelMatrixCache(str(tmp_path))
+    cache.put("a", X)
+    size = cache.nbytes
+
+    # Room for two matrices.
+    cache.max_bytes = 2 * size
+    cache.put("b", X)
+    cache.put("c", X)
+    assert "a" not in cache
+    assert "b" in cache and "c" in cache
+    assert cache.nbytes <= cache.max_bytes
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_get_model_matrix_cache(tmp_path, binary, sites, model_type):
+    cache = ModelMatrixCache(str(tmp_path))
+    X = get_model_matrix(binary, sites, model_type=model_type)
+
+    X1 = get_model_matrix(binary, sites, model_type=model_type, cache=cache)
+    np.testing.assert_array_equal(X1, X)
+    assert cache.key(binary, sites, model_type=model_type) in cache
+
+    # Second call reads the matrix back from disk.
+    X2 = get_model_matrix(binary, sites, model_type=model_type, cache=cache)
+    assert isinstance(X2, np.memmap)
+    np.testing.assert_array_equal(X2, X)
+
+
+def test_matrix_cache_dedup(binary, sites):
+    X = get_model_matrix(binary, sites)
+    cache = MatrixCache()
+    cache["obs"] = X
+    cache["fit"] = X
+    # Views of the same memory share the buffer.
+    cache["predict"] = X[:]
+    assert len(cache) == 3
+    assert cache.nbytes == X.nbytes
+
+    # Copies are not compared by value.
+    Xc = X.copy()
+    assert cache.put("copy", Xc) is Xc
+    assert cache["obs"] is X
+    assert cache.nbytes == 2 * X.nbytes
+
+    del cache["obs"], cache["fit"], cache["copy"]
+    assert cache.nbytes == X.nbytes
+    del cache["predict"]
+    assert cache.nbytes == 0
+
+
+def test_matrix_cache_lru(binary, sites):
+    X = get_model_matrix(binary, sites)
+    cache = MatrixCache(max_bytes=2 * X.nbytes)
+    cache.put("a", X, source="obs")
+    cache.put("b", X + 1, source="obs")
+    assert cache["a"] is X
+    cache.put("c", X + 2, source="obs")
+
+    # "b" is the least recently used; its source is remembered.
+    assert "b" not in cache
+    assert list(cache) == ["a", "c"]
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get("b") is None
+    assert cache.source("b") == "obs"
+
+    stats = cache.stats
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+    # Matrices without a source are never dropped.
+    cache["user"] = X + 3
+    assert "user" in cache
+    assert list(cache) == ["c", "user"]
+    cache["other"] = X + 4
+    assert "user" in cache and "other" in cache
+    assert cache.source("user") is None
+
+
+class Map(object):
+    """Stand-in for a genotype-phenotype map."""
+    def __init__(self, genotypes):
+        self.wildtype = genotypes[0]
+        self.genotypes = genotypes
+        self.mutations = {i: ["0", "1"] for i in range(len(genotypes[0]))}
+
+
+def test_matrix_registry(binary, sites):
+    gpm = Map(binary)
+    registry = MatrixRegistry()
+    assert registry.get(gpm, sites) is None
+
+    X = get_model_matrix(binary, sites)
+    registry.put(gpm, sites, X)
+    assert registry.get(gpm, sites) is X
+
+    # Leading columns are views of the registered matrix.
+    X1 = registry.get(gpm, sites[:5])
+    assert np.shares_memory(X1, X)
+    np.testing.assert_array_equal(X1, X[:, :5])
+
+    # Copies of the map share matrices; other genotypes do not.
+    assert registry.get(Map(list(binary)), sites) is X
+    assert registry.get(Map(binary[::-1]), sites) is None
+
+    # Other model types and sites are not served.
+    assert registry.get(gpm, sites, model_type="local") is None
+    assert registry.get(gpm, sites, dtype=np.float64) is None
+    assert registry.get(gpm, sites[1:]) is None
+
+    # Matrices are held only while in use.
+    del X, X1
+    assert registry.get(gpm, sites) is None
+
+
+def test_svd_cache(binary, sites):
+    # Rank-deficient matrix: fewer genotypes than sites.
+    X = get_model_matrix(binary[:9], sites)
+    y = np.random.randn(9, 2)
+    svd = SVDCache()
+    coef = svd.solve(X, y)
+    np.testing.assert_almost_equal(coef, np.linalg.lstsq(X, y, rcond=None)[0])
+    assert svd.rank == np.linalg.matrix_rank(X)
+
+    # Views of the same matrix reuse the decomposition.
+    U = svd.U
+    svd.solve(X[:], y[:, 0])
+    assert svd.U is U
+    svd.solve(X.copy(), y[:, 0])
+    assert svd.U is not U
+
+    # The matrix is not kept alive by its decomposition.
+    X2 = X.copy()
+    svd.solve(X2[:], y[:, 0])
+    ref = svd._ref
+    del X2
+    assert ref() is None
+
+    # Ridge solutions.
+    alpha = 0.5
+    ridge = np.linalg.solve(X.T.dot(X) + alpha * np.eye(X.shape[1]),
+                            X.T.dot(y))
+    np.testing.assert_almost_equal(svd.solve(X, y, alpha=alpha), ridge)
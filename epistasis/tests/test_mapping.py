@@ -23,3 +23,211 @@
 #     check = [tuple(x) for x in check]
 #     # Run tests
 #     tools.assert_equals(set(expected), set(check))
+
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from ..mapping import (mutations_to_sites,
+                       supported_sites,
+                       SiteSpace,
+                       SiteIndex,
+                       EpistasisMap)
+from ..matrix import SiteTable
+
+
+def test_mutations_to_sites():
+    mutations = {0: ["A", "V"], 1: ["A", "V", "L"], 2: None, 3: ["A", "V"]}
+    sites = mutations_to_sites(2, mutations)
+    assert isinstance(sites, SiteTable)
+    assert sites.tolist() == [[0], [1], [2], [3], [4],
+                              [1, 2], [1, 3], [1, 4], [2, 4], [3, 4]]
+    np.testing.assert_array_equal(sites.orders, [1] * 5 + [2] * 5)
+
+    # Only higher order sites.
+    assert mutations_to_sites(2, mutations, start_order=2) == sites[5:]
+
+
+def test_site_space():
+    mutations = {0: ["A", "V"], 1: ["A", "V", "L"], 2: None, 3: ["A", "V"],
+                 4: ["A", "C", "G", "T"]}
+    sites = mutations_to_sites(3, mutations)
+    space = SiteSpace(3, mutations)
+
+    # Closed form counts.
+    assert space.counts == {0: 1, 1: 7, 2: 17, 3: 17}
+    assert len(space) == len(sites)
+    assert space.nbytes(10, dtype=np.float64) == 10 * len(sites) * 8
+
+    # Random access and blocks match the full list.
+    assert [space[i] for i in range(len(space))] == sites.tolist()
+    assert space[-1] == sites[-1]
+    blocks = list(space.blocks(block_size=4))
+    assert sum(len(b) for b in blocks) == len(sites)
+    assert [s for b in blocks for s in b] == sites.tolist()
+    assert space == sites
+
+    # Higher orders only.
+    assert SiteSpace(3, mutations, start_order=2) == sites[8:]
+
+
+def test_supported_sites():
+    mutations = {0: ["A", "V"], 1: ["A", "V", "L"], 2: ["A", "V"]}
+    # binary: site 1 (V at 0), sites 2, 3 (V, L at 1), site 4 (V at 2)
+    binary = ["0000", "1000", "1100", "1101", "0011", "1011"]
+    sites = supported_sites(3, mutations, binary, min_support=2)
+    assert sites.tolist() == [[0], [1], [2], [3], [4],
+                              [1, 2], [1, 4], [3, 4]]
+
+    # Minimum support of 1 keeps sites carried by any genotype.
+    sites = supported_sites(3, mutations, binary, min_support=1)
+    assert [1, 2, 4] in sites.tolist()
+    assert [2, 3] not in sites.tolist()
+
+
+def test_epistasis_map_sites():
+    mutations = {0: ["A", "V"], 1: ["A", "V"], 2: ["A", "V"]}
+    sites = mutations_to_sites(3, mutations)
+    epistasis = EpistasisMap(sites, order=3, values=np.arange(len(sites)))
+    assert epistasis.sites is sites
+    assert epistasis.n == 8
+    np.testing.assert_array_equal(epistasis.orders, [0, 1, 1, 1, 2, 2, 2, 3])
+    assert list(epistasis.get_orders(1).index) == [1, 2, 3]
+    assert list(epistasis.get_orders(0, 3).index) == [0, 7]
+
+    # Consecutive orders are views of the map.
+    orders = epistasis.get_orders(1, 2)
+    assert orders.sites.tolist() == sites[1:7].tolist()
+    np.testing.assert_array_equal(orders.values, np.arange(1, 7))
+    assert np.shares_memory(orders.values, epistasis.values)
+    np.testing.assert_array_equal(epistasis.get_orders(0, 3).values, [0, 7])
+
+    # Values are set in place or replaced.
+    orders.values[:] = 0
+    assert epistasis.values[1:7].sum() == 0
+    epistasis.values = np.ones(8)
+    assert epistasis.data["values"].sum() == 8
+    with pytest.raises(Exception):
+        epistasis.values = np.ones(3)
+
+    # Orders give pandas Series indexed by the terms of the map.
+    assert isinstance(orders.sites, pd.Series)
+    assert isinstance(orders.values, pd.Series)
+    assert list(orders.values.index) == [1, 2, 3, 4, 5, 6]
+
+    # data is built on request, so writes to it raise.
+    with pytest.raises(Exception):
+        epistasis.data["values"] = 0
+    with pytest.raises(Exception):
+        epistasis.data.loc[0, "values"] = 0
+    data = epistasis.data.copy()
+    data.loc[0, "values"] = 0
+    assert epistasis.values[0] == 1
+
+
+def test_epistasis_map_site_space():
+    mutations = {0: ["A", "V", "L"], 1: ["A", "V"], 2: ["A", "V"]}
+    sites = mutations_to_sites(3, mutations)
+    epistasis = EpistasisMap(SiteSpace(3, mutations), order=3,
+                             values=np.arange(len(sites)))
+
+    # Sites are only built when read.
+    assert epistasis.n == len(sites)
+    np.testing.assert_array_equal(epistasis.orders,
+                                  [0, 1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 3])
+    assert list(epistasis.get_orders(2).index) == [5, 6, 7, 8, 9]
+    np.testing.assert_array_equal(epistasis.get_orders(3).values, [10, 11])
+    assert epistasis._sites is None
+    assert epistasis.sites == sites
+    assert epistasis.index_of([2, 4]) == 8
+
+
+def test_site_index():
+    sites = [[0], [1], [2], [3], [1, 2], [1, 3], [2, 3]]
+    index = SiteIndex(sites)
+    assert len(index) == 7
+    np.testing.assert_array_equal(
+        index.lookup([[3, 2], [0], [1, 2, 3], [4], [1]]), [6, 0, -1, -1, 1])
+
+    # Add wider sites.
+    index.add([[1, 2, 3]])
+    np.testing.assert_array_equal(index.lookup([[2, 3, 1], [2, 3]]), [7, 6])
+
+
+def test_epistasis_map_lookup():
+    mutations = {0: ["A", "V"], 1: ["A", "V"], 2: ["A", "V"]}
+    epistasis = EpistasisMap(mutations_to_sites(2, mutations), order=2,
+                             values=np.arange(7))
+    assert epistasis.index_of([1, 3]) == 5
+    assert epistasis.index_of("2,3") == 6
+    np.testing.assert_array_equal(
+        epistasis.index_of(["1", [2, 1], [1, 2, 3]]), [1, 4, -1])
+    np.testing.assert_array_equal(
+        epistasis.get_values([[3, 2], [1, 2, 3]]), [6, np.nan])
+
+    # The index follows new sites.
+    epistasis.extend([[1, 2, 3]], values=[7])
+    assert epistasis.index_of([1, 2, 3]) == 7
+    assert epistasis.get_values([3, 1, 2]) == 7
+    assert list(epistasis.get_orders(3).index) == [7]
+
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_epistasis_map_npz(tmp_path, mmap_mode):
+    mutations = {0: ["A", "V"], 1: ["A", "V", "L"], 2: ["A", "V"]}
+    sites = mutations_to_sites(3, mutations)
+    epistasis = EpistasisMap(sites, order=3, values=np.random.randn(len(sites)),
+                             model_type="local")
+    filename = str(tmp_path / "epistasis.npz")
+    epistasis.to_npz(filename)
+
+    loaded = EpistasisMap.read_npz(filename, mmap_mode=mmap_mode)
+    assert loaded.order == 3
+    assert loaded.model_type == "local"
+    assert loaded.sites == sites
+    np.testing.assert_array_equal(loaded.values, epistasis.values)
+    np.testing.assert_array_equal(loaded.orders, epistasis.orders)
+    if mmap_mode is not None:
+        assert isinstance(loaded.values, np.memmap)
+
+    # Compressed files are read into memory.
+    epistasis.to_npz(filename, compress=True)
+    loaded = EpistasisMap.read_npz(filename, mmap_mode=mmap_mode)
+    np.testing.assert_array_equal(loaded.values, epistasis.values)
+    assert not isinstance(loaded.values, np.memmap)
+
+
+def test_epistasis_map_traits(tmp_path):
+    mutations = {0: ["A", "V"], 1: ["A", "V"], 2: ["A", "V"]}
+    values = np.arange(21.0).reshape(3, 7)
+    epistasis = EpistasisMap(mutations_to_sites(2, mutations), order=2,
+                             values=values, traits=["a", "b", "c"])
+    assert epistasis.n == 7
+    assert epistasis.n_traits == 3
+
+    # Traits x terms table.
+    table = epistasis.table
+    assert list(table.index) == ["a", "b", "c"]
+    assert list(table.columns) == ["0", "1", "2", "3", "1,2", "1,3", "2,3"]
+    np.testing.assert_array_equal(table.values, values)
+    np.testing.assert_array_equal(epistasis.data["b"], values[1])
+
+    # Terms are the last axis.
+    np.testing.assert_array_equal(epistasis.get_orders(1).values,
+                                  values[:, 1:4])
+    np.testing.assert_array_equal(epistasis.get_values([2, 3]), values[:, 6])
+    epistasis.extend([[1, 2, 3]])
+    assert epistasis.values.shape == (3, 8)
+    assert np.isnan(epistasis.values[:, 7]).all()
+
+    filename = str(tmp_path / "epistasis.npz")
+    epistasis.to_npz(filename)
+    loaded = EpistasisMap.read_npz(filename)
+    assert loaded.traits == ["a", "b", "c"]
+    np.testing.assert_array_equal(loaded.values, epistasis.values)
+
+    with pytest.raises(Exception):
+        epistasis.traits = ["a"]
+    with pytest.raises(Exception):
+        epistasis.values = np.ones((3, 7))
@@ -0,0 +1,323 @@
+# External imports
+import itertools as it
+import pytest
+
+import numpy as np
+
+# Module to test
+from ..matrix import (genotypes_to_array,
+                      encode_genotypes,
+                      encode_vectors,
+                      SiteTable,
+                      sites_to_table,
+                      build_model_matrix,
+                      _build_model_matrix,
+                      get_model_matrix,
+                      get_complete_index,
+                      walsh_hadamard_transform,
+                      subset_sum_transform,
+                      mobius_transform,
+                      pack_binary,
+                      pack_sites,
+                      build_packed_model_matrix,
+                      get_sparse_model_matrix,
+                      ModelMatrixOperator,
+                      extend_model_matrix,
+                      iter_model_matrix,
+                      popcount,
+                      pack_genotype_sets,
+                      site_support)
+
+
+@pytest.fixture
+def binary():
+    """Binary genotypes of a complete, 4-site map."""
+    return ["".join(g) for g in it.product("01", repeat=4)]
+
+
+@pytest.fixture
+def sites():
+    """All interaction sites up to third order for a 4-site map."""
+    sites = [[0]]
+    for order in range(1, 4):
+        sites += [list(c) for c in it.combinations(range(1, 5), order)]
+    return sites
+
+
+def reference_matrix(vectors, sites):
+    """Build a model matrix element by element."""
+    matrix = np.ones((len(vectors), len(sites)), dtype=int)
+    for i, vec in enumerate(vectors):
+        for j, site in enumerate(sites):
+            matrix[i, j] = np.prod(vec[site])
+    return matrix
+
+
+def test_genotypes_to_array():
+    codes = genotypes_to_array(["AV", "LV", "AA"])
+    assert codes.dtype == np.uint8
+    np.testing.assert_array_equal(codes, [[65, 86], [76, 86], [65, 65]])
+
+    with pytest.raises(Exception):
+        genotypes_to_array(["AV", "A"])
+
+
+def test_encode_genotypes():
+    wildtype = "AAA"
+    mutations = {0: ["A", "V"], 1: None, 2: ["A", "L", "V"]}
+    genotypes = ["AAA", "VAA", "ACL", "VAV"]
+    binary = encode_genotypes(wildtype, genotypes, mutations)
+    np.testing.assert_array_equal(binary, [[0, 0, 0],
+                                           [1, 0, 0],
+                                           [0, 1, 0],
+                                           [1, 0, 1]])
+
+    # Letters missing from the mutations dictionary.
+    with pytest.raises(Exception):
+        encode_genotypes(wildtype, ["AAT"], mutations)
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_encode_vectors(binary, model_type):
+    vectors = encode_vectors(binary, model_type=model_type)
+    assert vectors.shape == (16, 5)
+    np.testing.assert_array_equal(vectors[:, 0], 1)
+    bits = np.array([list(b) for b in binary], dtype=int)
+    if model_type == "global":
+        np.testing.assert_array_equal(vectors[:, 1:], 1 - 2 * bits)
+    else:
+        np.testing.assert_array_equal(vectors[:, 1:], bits)
+
+    # Arrays of 0/1 values encode the same way.
+    np.testing.assert_array_equal(
+        encode_vectors(bits.astype(np.uint8), model_type=model_type), vectors)
+
+
+def test_sites_to_table(sites):
+    site_table, site_orders = sites_to_table(sites)
+    assert site_table.dtype == np.int32
+    assert site_table.shape == (len(sites), 3)
+    np.testing.assert_array_equal(site_orders, [len(s) for s in sites])
+    for row, order, site in zip(site_table, site_orders, sites):
+        assert list(row[:order]) == site
+        assert not row[order:].any()
+
+
+@pytest.mark.parametrize("builder", [_build_model_matrix, build_model_matrix])
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_build_model_matrix(binary, sites, model_type, builder):
+    vectors = encode_vectors(binary, model_type=model_type)
+    site_table, site_orders = sites_to_table(sites)
+    X = builder(vectors, site_table, site_orders, n_threads=2)
+    np.testing.assert_array_equal(X, reference_matrix(vectors, sites))
+
+
+def test_build_model_matrix_blocks(binary, sites, monkeypatch):
+    # Force a block of rows smaller than the number of genotypes.
+    from .. import matrix
+    monkeypatch.setattr(matrix, "BLOCK_SIZE", 2 * len(sites))
+    vectors = encode_vectors(binary, model_type="global")
+    X = _build_model_matrix(vectors, *sites_to_table(sites))
+    np.testing.assert_array_equal(X, reference_matrix(vectors, sites))
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_get_model_matrix(binary, sites, model_type):
+    X = get_model_matrix(binary, sites, model_type=model_type)
+    assert X.shape == (len(binary), len(sites))
+    assert X.dtype == np.int8
+    # Intercept column is all ones.
+    np.testing.assert_array_equal(X[:, 0], 1)
+
+    # Optionally store as floats.
+    Xf = get_model_matrix(binary, sites, model_type=model_type,
+                          dtype=np.float32)
+    assert Xf.dtype == np.float32
+    np.testing.assert_array_equal(Xf, X)
+
+
+def test_get_complete_index(binary, sites):
+    # Third order sites are not a full-order model of 4 sites.
+    assert get_complete_index(binary, sites) is None
+
+    full_sites = sites + [[1, 2, 3, 4]]
+    rows, columns = get_complete_index(binary, full_sites)
+    assert sorted(rows) == list(range(16))
+    assert sorted(columns) == list(range(16))
+
+    # Missing genotypes.
+    assert get_complete_index(binary[1:], full_sites[1:]) is None
+
+
+def test_walsh_hadamard_transform(binary, sites):
+    full_sites = sites + [[1, 2, 3, 4]]
+    X = get_model_matrix(binary, full_sites, model_type="global")
+    rows, columns = get_complete_index(binary, full_sites)
+
+    y = np.random.randn(len(binary))
+    a = np.empty(len(y))
+    a[rows] = y
+    transformed = walsh_hadamard_transform(a)
+    np.testing.assert_almost_equal(transformed[columns], X.T.dot(y))
+
+
+def test_subset_sum_transform(binary, sites):
+    full_sites = sites + [[1, 2, 3, 4]]
+    X = get_model_matrix(binary, full_sites, model_type="local")
+    rows, columns = get_complete_index(binary, full_sites)
+
+    # Coefficients to phenotypes.
+    thetas = np.random.randn(len(full_sites))
+    a = np.empty(len(thetas))
+    a[columns] = thetas
+    y = subset_sum_transform(a)[rows]
+    np.testing.assert_almost_equal(y, X.dot(thetas))
+
+    # Phenotypes back to coefficients.
+    a = np.empty(len(y))
+    a[rows] = y
+    np.testing.assert_almost_equal(mobius_transform(a)[columns], thetas)
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_build_packed_model_matrix(binary, sites, model_type):
+    packed = pack_binary(binary)
+    masks = pack_sites(sites, n_words=packed.shape[1])
+    X = build_packed_model_matrix(packed, masks, model_type=model_type)
+    np.testing.assert_array_equal(
+        X, get_model_matrix(binary, sites, model_type=model_type))
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_build_packed_model_matrix_words(model_type):
+    # Genotypes longer than one 64-bit word.
+    binary = ["".join(g) for g in np.random.choice(["0", "1"], (20, 70))]
+    sites = [[0], [1], [64], [65], [70], [1, 65], [2, 64, 70]]
+    packed = pack_binary(binary)
+    assert packed.shape == (20, 2)
+
+    masks = pack_sites(sites, n_words=packed.shape[1])
+    X = build_packed_model_matrix(packed, masks, model_type=model_type)
+    vectors = encode_vectors(binary, model_type=model_type)
+    np.testing.assert_array_equal(X, reference_matrix(vectors, sites))
+
+
+def test_get_sparse_model_matrix(binary, sites):
+    X = get_sparse_model_matrix(binary, sites, model_type="local")
+    assert X.format == "csr"
+    np.testing.assert_array_equal(
+        X.toarray(), get_model_matrix(binary, sites, model_type="local"))
+
+    # Global model matrices are dense.
+    with pytest.raises(Exception):
+        get_sparse_model_matrix(binary, sites, model_type="global")
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_model_matrix_operator(binary, sites, model_type):
+    X = get_model_matrix(binary, sites, model_type=model_type)
+    operator = ModelMatrixOperator(binary, sites, model_type=model_type,
+                                   block_size=3)
+    assert operator.shape == X.shape
+    np.testing.assert_array_equal(operator.toarray(), X)
+
+    thetas = np.random.randn(len(sites))
+    np.testing.assert_almost_equal(operator.dot(thetas), X.dot(thetas))
+
+    y = np.random.randn(len(binary))
+    np.testing.assert_almost_equal(operator.T.dot(y), X.T.dot(y))
+    np.testing.assert_almost_equal(operator.H.dot(y), X.T.dot(y))
+    np.testing.assert_almost_equal(operator.T.T.dot(thetas), X.dot(thetas))
+
+    Y = np.random.randn(len(binary), 2)
+    np.testing.assert_almost_equal(operator.T.dot(Y), X.T.dot(Y))
+
+
+@pytest.mark.parametrize("model_type", ["global", "local"])
+def test_extend_model_matrix(binary, sites, model_type):
+    # Sites are ordered by order; split off the third order sites.
+    n = sum(len(s) < 3 for s in sites)
+    X = get_model_matrix(binary, sites[:n], model_type=model_type)
+    Xext = extend_model_matrix(X, sites[:n], sites[n:])
+    np.testing.assert_array_equal(
+        Xext, get_model_matrix(binary, sites, model_type=model_type))
+
+    # Sparse matrices
+    if model_type == "local":
+        Xs = get_sparse_model_matrix(binary, sites[:n])
+        Xext = extend_model_matrix(Xs, sites[:n], sites[n:])
+        np.testing.assert_array_equal(
+            Xext.toarray(), get_model_matrix(binary, sites, model_type="local"))
+
+    # Several orders at once; parents are among the new columns.
+    Xext = extend_model_matrix(X[:, :5], sites[:5], sites[5:])
+    np.testing.assert_array_equal(
+        Xext, get_model_matrix(binary, sites, model_type=model_type))
+    if model_type == "local":
+        Xext = extend_model_matrix(Xs[:, :5], sites[:5], sites[5:])
+        np.testing.assert_array_equal(
+            Xext.toarray(), get_model_matrix(binary, sites, model_type="local"))
+
+    # Parents must be in the matrix.
+    with pytest.raises(Exception):
+        extend_model_matrix(X[:, :5], sites[:5], sites[n:])
+
+
+def test_iter_model_matrix(binary, sites):
+    X = get_model_matrix(binary, sites, model_type="global")
+
+    # Blocks of 3 rows (1 byte per element).
+    blocks = list(iter_model_matrix(iter(binary), sites, model_type="global",
+                                    max_bytes=3 * len(sites)))
+    assert len(blocks) == 6
+    for rows, Xblock in blocks:
+        assert Xblock.shape[0] <= 3
+        np.testing.assert_array_equal(Xblock, X[rows])
+
+    # Arrays of 0/1 values are sliced into blocks.
+    bits = np.array([list(b) for b in binary], dtype=np.uint8)
+    blocks = list(iter_model_matrix(bits, sites, model_type="global",
+                                    max_bytes=3 * len(sites)))
+    assert len(blocks) == 6
+    for rows, Xblock in blocks:
+        np.testing.assert_array_equal(Xblock, X[rows])
+
+
+def test_site_table(sites):
+    table = SiteTable.from_sites(sites)
+    assert len(table) == len(sites)
+    assert table.max_order == 3
+    assert table == sites
+    assert table.tolist() == sites
+    assert table[4] == sites[4]
+    assert SiteTable.from_sites(table) is table
+    np.testing.assert_array_equal(sites_to_table(table)[0],
+                                  sites_to_table(sites)[0])
+
+    # Slices are tables that view the same memory.
+    head = table[:5]
+    assert isinstance(head, SiteTable)
+    assert np.shares_memory(head.table, table.table)
+    assert head == sites[:5]
+    assert head + table[5:] == table
+    assert sites[:5] + table[5:] == table
+
+    # Kernels give the same matrices for tables and lists.
+    binary = ["".join(g) for g in it.product("01", repeat=4)]
+    np.testing.assert_array_equal(get_model_matrix(binary, table),
+                                  get_model_matrix(binary, sites))
+    np.testing.assert_array_equal(pack_sites(table), pack_sites(sites))
+
+
+def test_site_support(binary, sites):
+    # Support is the number of ones in each column of a local model matrix.
+    X = get_model_matrix(binary[:11], sites, model_type="local")
+    np.testing.assert_array_equal(site_support(binary[:11], sites),
+                                  X.sum(axis=0))
+    np.testing.assert_array_equal(
+        site_support(pack_genotype_sets(binary[:11]), sites, max_bytes=8),
+        X.sum(axis=0))
+
+    # Count bits of 64-bit words.
+    words = np.array([0, 1, 2**64 - 1, 2**63 + 5], dtype=np.uint64)
+    np.testing.assert_array_equal(popcount(words), [0, 1, 64, 3])
@@ -0,0 +1,59 @@
+# External imports
+import pickle
+import multiprocessing
+
+import pytest
+import numpy as np
+
+# Module to test
+from ..shared import (SharedArray, share_array, share_arrays,
+                      HAS_SHARED_MEMORY)
+
+pytestmark = pytest.mark.skipif(not HAS_SHARED_MEMORY,
+                                reason="requires Python 3.8 or later")
+
+
+def column_sums(handle):
+    """Sum the columns of a shared array in a worker."""
+    X = handle.open()
+    sums = X.sum(axis=0)
+    handle.close()
+    return sums
+
+
+def test_share_array():
+    X = np.random.choice([-1, 1], size=(256, 5)).astype(np.int8)
+    handle = share_array(X)
+    try:
+        assert handle.shape == X.shape
+        assert handle.dtype == X.dtype
+        assert handle.nbytes == X.nbytes
+
+        # Handles pickle without the data.
+        copy = pickle.loads(pickle.dumps(handle))
+        assert isinstance(copy, SharedArray)
+        assert len(pickle.dumps(handle)) < X.nbytes
+
+        # Views of the same memory.
+        Xshared = copy.open()
+        np.testing.assert_array_equal(Xshared, X)
+        handle.open()[0, 0] = 5
+        assert Xshared[0, 0] == 5
+        copy.close()
+    finally:
+        handle.unlink()
+
+
+def test_share_arrays_workers():
+    X = np.random.randn(32, 4)
+    handles = share_arrays(X=X, y=X[:, 0])
+    try:
+        assert set(handles) == {"X", "y"}
+        with multiprocessing.Pool(2) as pool:
+            sums = pool.map(column_sums, [handles["X"]] * 4)
+        for s in sums:
+            np.testing.assert_almost_equal(s, X.sum(axis=0))
+        np.testing.assert_array_equal(handles["y"].open(), X[:, 0])
+    finally:
+        for handle in handles.values():
+            handle.unlink()
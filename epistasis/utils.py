@@ -11,10 +11,12 @@ from scipy.misc import comb
 from sklearn.metrics import mean_squared_error
 from collections import OrderedDict
 
-from gpmap.utils import genotypes_to_binary
 from .mapping import mutations_to_sites
 
-from epistasis.matrix import get_model_matrix
+from epistasis.matrix import (get_model_matrix,
+                              get_sparse_model_matrix,
+                              genotypes_to_array,
+                              encode_genotypes)
 
 
 # -------------------------------------------------------
@@ -31,16 +33,34 @@ class SubclassException(Exception):
 def genotypes_to_X(wildtype, genotypes,
     order=1,
     mutations=None,
-    model_type='global'):
-    """Build an X matrix for a list of genotypes."""
+    model_type='global',
+    sparse=False,
+    sites=None,
+    dtype=np.int8,
+    cache=None):
+    """Build an X matrix for a list of genotypes.
+
+    The columns are the interaction sites up to the given order, or the
+    given sites.
+
+    If sparse is True, returns a scipy.sparse.csr_matrix (local models only).
+    If cache is a ModelMatrixCache, dense matrices are read from and written
+    to the on-disk cache.
+    """
     # Binary representation
-    binary = genotypes_to_binary(wildtype, genotypes, mutations)
+    binary = encode_genotypes(wildtype, genotypes, mutations)
 
     # Build list of sites from genotypes.
-    sites = mutations_to_sites(order, mutations)
+    if sites is None:
+        sites = mutations_to_sites(order, mutations)
 
     # X matrix
-    X = get_model_matrix(binary, sites, model_type=model_type)
+    if sparse:
+        X = get_sparse_model_matrix(binary, sites, model_type=model_type,
+                                    dtype=dtype)
+    else:
+        X = get_model_matrix(binary, sites, model_type=model_type,
+                             dtype=dtype, cache=cache)
     return X
 
 # -------------------------------------------------------
@@ -97,12 +117,16 @@ class Bunch:
 def extract_mutations_from_genotypes(genotypes):
     """ Given a list of genotypes, infer a mutations dictionary.
     """
-    genotypes_grid = [list(g) for g in genotypes]
-    genotypes_array = np.array(genotypes_grid)
-    (n_genotypes, n_sites) = genotypes_array.shape
+    codes = genotypes_to_array(genotypes)
+    (n_genotypes, n_sites) = codes.shape
+
+    # Letters present at each site.
+    present = np.zeros((n_sites, 128), dtype=bool)
+    present[np.arange(n_sites), codes] = True
+
     mutations = dict([(i, None) for i in range(n_sites)])
     for i in range(n_sites):
-        unique = list(np.unique(genotypes_array[:, i]))
+        unique = [chr(c) for c in np.nonzero(present[i])[0]]
         if len(unique) != 1:
             mutations[i] = unique
     return mutations
@@ -7,6 +7,7 @@
 import io
 import os
 import sys
+import tempfile
 from shutil import rmtree
 
 from setuptools import find_packages, setup, Command, Extension
@@ -26,10 +27,41 @@ REQUIRED = [
     #"numpy",
 ]
 
-# Extensions
+
+def has_openmp():
+    """Check whether the C compiler can build and link OpenMP code."""
+    from distutils.ccompiler import new_compiler
+    from distutils.errors import CompileError, LinkError
+    from distutils.sysconfig import customize_compiler
+
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmpdir, 'openmp_check.c')
+        with open(src, 'w') as f:
+            f.write('#include <omp.h>\n'
+                    'int main(void) { return omp_get_max_threads() < 1; }\n')
+        objects = compiler.compile([src], output_dir=tmpdir,
+                                   extra_postargs=['-fopenmp'])
+        compiler.link_executable(objects,
+                                 os.path.join(tmpdir, 'openmp_check'),
+                                 extra_postargs=['-fopenmp'])
+    except (CompileError, LinkError):
+        return False
+    finally:
+        rmtree(tmpdir)
+    return True
+
+
+# Extensions. Without OpenMP support (e.g. Apple clang), the prange loops in
+# matrix_cython run serially.
+openmp_args = ['-fopenmp'] if has_openmp() else []
 extension = Extension('epistasis.matrix_cython',
                       ['epistasis/matrix_cython.c'],
-                      include_dirs=[numpy.get_include()])
+                      include_dirs=[numpy.get_include()],
+                      extra_compile_args=openmp_args,
+                      extra_link_args=openmp_args)
 
 # The rest you shouldn't have to touch too much :)
 # ------------------------------------------------